@@ -0,0 +1,240 @@
+"""
+Measure commands against local fake Jira server.
+
+For every dataset size runs `sync -f`, incremental `sync`, `index`,
+`workon <keyword>`, `start`, `review` and `resolve` as separate processes
+against `jira_server.FakeJira`, then JSON and SQLite storage operations
+in-process. Reports wall time, Jira requests and response bytes.
+
+Everything runs in temporary HOME and git repository. Interactive choosers
+select all matching issues, pull requests are not opened in browser.
+Results saved with `--save` can be compared with later runs with
+`--compare`, which fails when request count grows or time grows by half
+(and more than `TIME_SLACK`).
+
+    python benchmarks/commands.py --sizes 10,100,1000 --latency 0.02
+"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import click
+
+from jira_server import Dataset, FakeJira
+
+SUBTASKS_PER_STORY = 4
+COMMANDS = [
+    ('sync -f', ['sync', '-f']),
+    ('sync', ['sync']),
+    ('index', ['index']),
+    ('workon', ['workon', '{keyword}']),
+    ('start', ['start']),
+    ('review', ['review']),
+    ('resolve', ['resolve']),
+]
+TIME_TOLERANCE = 1.5
+TIME_SLACK = 0.05
+
+
+def run_command(argv):
+    """Run git-flow in this process with non-interactive choosers."""
+    import webbrowser
+    from jira_git_flow import cli, git_flow
+    from jira_git_flow.storage import storage
+    from jira_git_flow.util import get_flatten_issues
+
+    webbrowser.open = lambda url: True
+    cli.choose_interactive = lambda filter_function=lambda issue: True: [
+        issue for issue in get_flatten_issues(storage.get_stories()) if filter_function(issue)]
+    cli.choose_issues_from_simple_view = lambda issues: issues[0]
+    git_flow.main(argv, prog_name='git-flow')
+
+
+class Environment(object):
+    """Temporary HOME with git-flow configuration and git repository."""
+    def __init__(self, server):
+        self.directory = tempfile.mkdtemp()
+        self.home = os.path.join(self.directory, 'home')
+        self.repo = os.path.join(self.directory, 'repo')
+        self.remote = os.path.join(self.directory, 'remote.git')
+        self.env = dict(os.environ, HOME=self.home)
+        self.base = os.path.join(self.home, '.config', 'jira-git-flow')
+        self._configure(server)
+        self._create_repo()
+
+    def _configure(self, server):
+        # The first runs create default credentials and configuration.
+        for _ in range(2):
+            subprocess.run([sys.executable, '-c', 'import jira_git_flow'], env=self.env,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        config_file = os.path.join(self.base, 'config.json')
+        with open(config_file) as f:
+            config = json.load(f)
+        config.update({'url': server.url, 'project': server.dataset.project})
+        with open(config_file, 'w') as f:
+            json.dump(config, f)
+
+    def _create_repo(self):
+        subprocess.check_call(['git', 'init', '-q', '--bare', self.remote])
+        subprocess.check_call(['git', 'init', '-q', self.repo])
+        # Commands commit as well.
+        subprocess.check_call(['git', 'config', 'user.name', 'benchmark'], cwd=self.repo)
+        subprocess.check_call(['git', 'config', 'user.email', 'benchmark@localhost'], cwd=self.repo)
+        subprocess.check_call(['git', 'commit', '-q', '--allow-empty', '-m', 'Initial'], cwd=self.repo)
+        subprocess.check_call(['git', 'remote', 'add', 'origin', 'git@github.com:benchmark/project.git'],
+                              cwd=self.repo)
+        subprocess.check_call(['git', 'config', 'remote.origin.pushurl', self.remote], cwd=self.repo)
+
+    def reset(self, dataset):
+        """Track all stories of dataset, drop caches and create subtask branches."""
+        for name in ['data.json', 'data.sqlite', 'index.json', 'transitions.json']:
+            path = os.path.join(self.base, name)
+            if os.path.exists(path):
+                os.remove(path)
+        stories = []
+        for issue in dataset.issues.values():
+            if issue['type'] == 'story':
+                stories.append(dict(_local(issue), subtasks=[
+                    _local(dataset.issues[key]) for key in issue['subtasks']]))
+        with open(os.path.join(self.base, 'data.json'), 'w') as f:
+            json.dump({'current_story': None, 'current_issue': None, 'stories': stories}, f)
+
+        code = ('import sys, json\n'
+                'from jira_git_flow.models import JiraIssue\n'
+                'from jira_git_flow.util import generate_branch_name\n'
+                'for issue in json.load(sys.stdin):\n'
+                '    print(generate_branch_name(JiraIssue(*issue)))\n')
+        subtasks = [[s['key'], s['summary'], s['type'], s['status']]
+                    for story in stories for s in story['subtasks']]
+        branches = subprocess.run([sys.executable, '-c', code], env=self.env, check=True,
+                                  input=json.dumps(subtasks).encode(), stdout=subprocess.PIPE)
+        head = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=self.repo).decode().strip()
+        refs = ''.join('update refs/heads/{} {}\n'.format(branch, head)
+                       for branch in branches.stdout.decode().split())
+        subprocess.run(['git', 'update-ref', '--stdin'], cwd=self.repo, input=refs.encode(), check=True)
+        shutil.rmtree(self.remote)
+        subprocess.check_call(['git', 'init', '-q', '--bare', self.remote])
+
+    def run(self, argv):
+        result = subprocess.run([sys.executable, os.path.abspath(__file__), '--command'] + argv,
+                                cwd=self.repo, env=self.env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        if result.returncode:
+            raise RuntimeError('git-flow {} failed:\n{}'.format(' '.join(argv), result.stdout.decode()))
+
+    def remove(self):
+        shutil.rmtree(self.directory)
+
+
+def _local(issue):
+    status = {'Open': 'open', 'In Progress': 'in_progress', 'Review': 'in_review'}.get(issue['status'], 'resolved')
+    return {'key': issue['key'], 'summary': issue['summary'], 'type': issue['type'], 'status': status}
+
+
+def measure_commands(environment, server, size):
+    dataset = server.dataset = Dataset(stories=max(size // (SUBTASKS_PER_STORY + 1), 1),
+                                       subtasks=SUBTASKS_PER_STORY)
+    environment.reset(dataset)
+    last_story = [issue for issue in dataset.issues.values() if issue['type'] == 'story'][-1]
+    results = []
+    for name, argv in COMMANDS:
+        argv = [arg.format(keyword=last_story['summary']) for arg in argv]
+        server.reset_stats()
+        start = time.perf_counter()
+        environment.run(argv)
+        results.append((name, size, time.perf_counter() - start, server.stats['requests'], server.stats['bytes']))
+    return results
+
+
+def measure_storage(environment, size):
+    """Measure storage operations of JSON and SQLite backends with data of the last command run."""
+    code = '''
+import json, os, sys, time
+from jira_git_flow import config
+from jira_git_flow.storage import Storage
+from jira_git_flow.sqlite_storage import SqliteStorage
+from jira_git_flow.util import get_flatten_issues
+
+def timed(function):
+    times = []
+    for _ in range(3):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+database = config.DATABASE_FILE + '.benchmark'
+results = []
+for name, create in [('json', lambda: Storage(config.DATA_FILE)),
+                     ('sqlite', lambda: SqliteStorage(database, json_file=config.DATA_FILE))]:
+    storage = create()
+    if name == 'sqlite':
+        storage.db
+    load = timed(lambda: create().get_stories())
+    stories = storage.get_stories()
+    issues = get_flatten_issues(stories)
+    update = timed(lambda: storage.update_issues(issues))
+    sync = timed(lambda: storage.sync(stories, time.time()))
+    results += [(name + ' load', load), (name + ' update all', update), (name + ' sync', sync)]
+if os.path.exists(database):
+    os.remove(database)
+print(json.dumps(results))
+'''
+    output = subprocess.check_output([sys.executable, '-c', code], env=environment.env, stderr=subprocess.DEVNULL)
+    return [('storage ' + name, size, seconds, 0, 0) for name, seconds in json.loads(output.decode().splitlines()[-1])]
+
+
+def compare(results, baseline):
+    regressions = []
+    for name, size, seconds, requests_count, _ in results:
+        previous = baseline.get('{}:{}'.format(name, size))
+        if not previous:
+            continue
+        if requests_count > previous['requests']:
+            regressions.append('{} ({} issues): {} requests, was {}'.format(
+                name, size, requests_count, previous['requests']))
+        if seconds > previous['seconds'] * TIME_TOLERANCE + TIME_SLACK:
+            regressions.append('{} ({} issues): {:.3f} s, was {:.3f} s'.format(
+                name, size, seconds, previous['seconds']))
+    return regressions
+
+
+@click.command()
+@click.option('--sizes', default='10,100,1000', help='Comma separated numbers of issues.')
+@click.option('--latency', default=0.02, help='Jira response latency in seconds.')
+@click.option('--save', type=click.Path(), help='Save results to JSON file.')
+@click.option('--compare', 'baseline', type=click.File(), help='Compare with results saved before.')
+def main(sizes, latency, save, baseline):
+    server = FakeJira(Dataset(stories=0), latency=latency).start()
+    environment = Environment(server)
+    results = []
+    print('{:<26} {:>7} {:>10} {:>9} {:>11}'.format('operation', 'issues', 'seconds', 'requests', 'bytes'))
+    try:
+        for size in [int(size) for size in sizes.split(',')]:
+            for result in measure_commands(environment, server, size) + measure_storage(environment, size):
+                results.append(result)
+                print('{:<26} {:>7} {:>10.3f} {:>9} {:>11}'.format(*result))
+    finally:
+        environment.remove()
+        server.shutdown()
+
+    if save:
+        with open(save, 'w') as f:
+            json.dump({'{}:{}'.format(name, size): {'seconds': seconds, 'requests': requests_count}
+                       for name, size, seconds, requests_count, _ in results}, f, indent=4)
+    if baseline:
+        regressions = compare(results, json.load(baseline))
+        for regression in regressions:
+            print('Regression: ' + regression)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--command']:
+        run_command(sys.argv[2:])
+    else:
+        main()
@@ -0,0 +1,44 @@
+"""
+Compare Jira payload size with and without field projection.
+
+Fetches tracked stories the way `git-flow sync` does and a single issue
+the way `workon -k` does, once requesting all fields and once requesting
+only the fields used by the tool. Uses configured Jira instance.
+
+    python benchmarks/fields.py
+"""
+import time
+
+from jira_git_flow import config
+from jira_git_flow.jira_api import FIELDS, Jira
+from jira_git_flow.storage import storage
+
+
+def measure(fields, keys):
+    jira = Jira(config.URL, config.EMAIL, config.TOKEN, config.PROJECT, config.MAX_RESULTS)
+    jira.jira  # connect before measuring
+    jira.fields = fields
+    results = []
+    for name, read in [('sync', lambda: jira.get_issues_by_keys(keys)),
+                       ('get issue', lambda: jira.get_issue_by_key(keys[0]))]:
+        requests_count, bytes_count = jira.requests_count, jira.bytes_count
+        start = time.time()
+        read()
+        results.append((name, jira.requests_count - requests_count,
+                        jira.bytes_count - bytes_count, time.time() - start))
+    return results
+
+
+def main():
+    keys = [story.key for story in storage.get_stories()]
+    if not keys:
+        exit('No stories in local storage, add some with `git-flow workon`.')
+
+    print('{:<10} {:<10} {:>9} {:>12} {:>9}'.format('fields', 'read', 'requests', 'bytes', 'seconds'))
+    for label, fields in [('all', ['*all']), ('projected', FIELDS + config.EXTRA_FIELDS)]:
+        for name, requests_count, bytes_count, seconds in measure(fields, keys):
+            print('{:<10} {:<10} {:>9} {:>12} {:>9.3f}'.format(label, name, requests_count, bytes_count, seconds))
+
+
+if __name__ == '__main__':
+    main()
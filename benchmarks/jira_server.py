@@ -0,0 +1,287 @@
+"""
+Local stand-in for the Jira REST endpoints used by jira-git-flow.
+
+Serves search (with the subset of JQL the tool generates), issue get and
+create, transitions and assignee endpoints over generated dataset. Every
+response is delayed by `latency` seconds and counted in `stats`.
+
+    python benchmarks/jira_server.py [port] [stories]
+"""
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, urlparse
+
+TYPES = {'story': 'Story', 'feature': 'Feature Sub-task', 'bug': 'BugFix Sub-task'}
+TRANSITIONS = {
+    'Open': [('11', 'Start progress', 'In Progress')],
+    'In Progress': [('21', 'To review', 'Review'), ('22', 'Submit to review', 'Review')],
+    'Review': [('31', 'Resolve', 'Resolved')],
+    'Resolved': [('41', 'Release', 'Done')],
+    'Done': [],
+}
+DESCRIPTION = 'Lorem ipsum dolor sit amet, consectetur adipiscing elit. ' * 40
+CLAUSE = re.compile(
+    r'(?P<field>key|parent|summary|type|updated|project)\s*'
+    r'(?P<op>in|=|~|>=)\s*'
+    r'(?P<value>\([^)]*\)|"(?:[^"\\]|\\.)*"|[^\s()]+)', re.IGNORECASE)
+# Clause results, boolean operators and parentheses left after clauses are evaluated.
+TOKEN = re.compile(r'\s*(_\d+|and\b|or\b|not\b|[()])', re.IGNORECASE)
+
+
+class Dataset(object):
+    """Project with `stories` stories having `subtasks` feature subtasks each."""
+    def __init__(self, project='PRJ', stories=10, subtasks=3):
+        self.project = project
+        self.issues = {}
+        self.lock = threading.Lock()
+        self.counter = 0
+        self.clock = 0
+        for _ in range(stories):
+            story = self.add('story', 'Story {}'.format(self.counter + 1))
+            for _ in range(subtasks):
+                self.add('feature', 'Feature {}'.format(self.counter + 1), parent=story['key'])
+
+    def add(self, type, summary, parent=None, status='Open'):
+        self.counter += 1
+        key = '{}-{}'.format(self.project, self.counter)
+        issue = {'key': key, 'summary': summary, 'type': type, 'status': status,
+                 'parent': parent, 'subtasks': [], 'updated': self.tick(), 'mtime': time.time() - 86400}
+        self.issues[key] = issue
+        if parent:
+            self.issues[parent]['subtasks'].append(key)
+        return issue
+
+    def tick(self):
+        self.clock += 1
+        return self.clock
+
+    def to_json(self, issue, fields=None, nested=False):
+        data = {
+            'summary': issue['summary'],
+            'status': {'name': issue['status'], 'description': DESCRIPTION[:200]},
+            'issuetype': {'name': TYPES[issue['type']], 'subtask': issue['type'] != 'story',
+                          'description': DESCRIPTION[:100]},
+        }
+        if not nested:
+            data.update({
+                'subtasks': [self.to_json(self.issues[k], nested=True) for k in issue['subtasks']],
+                'updated': '2019-01-01T00:{:02d}:{:02d}.000+0000'.format(*divmod(issue['updated'] % 3600, 60)),
+                'description': DESCRIPTION,
+                'comment': {'comments': [{'body': DESCRIPTION}] * 3},
+                'customfield_10000': DESCRIPTION,
+            })
+            if issue['parent']:
+                data['parent'] = {'key': issue['parent'],
+                                  'fields': {'summary': self.issues[issue['parent']]['summary']}}
+        if fields and fields not in ('*all', '*navigable'):
+            wanted = set(fields.split(','))
+            data = {k: v for k, v in data.items() if k in wanted}
+        return {'id': issue['key'].split('-')[1], 'key': issue['key'],
+                'self': 'http://jira/rest/api/2/issue/' + issue['key'], 'fields': data}
+
+    def matches(self, issue, jql):
+        jql = re.split(r'\border by\b', jql, flags=re.IGNORECASE)[0]
+        values = []
+
+        def clause(match):
+            values.append(self._clause(issue, match))
+            return ' _{} '.format(len(values) - 1)
+
+        expression = CLAUSE.sub(clause, jql).strip()
+        if not expression:
+            return True
+        return _evaluate(expression, values)
+
+    def _clause(self, issue, match):
+        field, op, value = match.group('field').lower(), match.group('op').lower(), match.group('value')
+        if value.startswith('('):
+            value = [v.strip().strip('"') for v in value[1:-1].split(',')]
+        else:
+            if value.startswith('"'):
+                value = value[1:-1]
+            value = re.sub(r'\\(.)', r'\1', value)
+        if field == 'key':
+            return issue['key'] in value if op == 'in' else issue['key'] == value
+        if field == 'parent':
+            return issue['parent'] in value if op == 'in' else issue['parent'] == value
+        if field == 'summary':
+            # Text search escapes its special characters.
+            value = re.sub(r'\\(.)', r'\1', value)
+            return all(word in issue['summary'].lower() for word in value.lower().split())
+        if field == 'type':
+            return TYPES[issue['type']].lower() == value.lower()
+        if field == 'project':
+            return value == self.project
+        if field == 'updated':
+            match = re.match(r'^-(\d+)m$', value)
+            return not match or issue['mtime'] >= time.time() - 60 * int(match.group(1))
+        return False
+
+
+def _evaluate(expression, values):
+    """Evaluate `_N` clause results joined with and, or, not and parentheses."""
+    tokens, position = [], 0
+    while position < len(expression):
+        match = TOKEN.match(expression, position)
+        if not match:
+            raise ValueError('Unsupported JQL: {}'.format(expression[position:].strip()))
+        tokens.append(match.group(1).lower())
+        position = match.end()
+
+    def disjunction(i):
+        value, i = conjunction(i)
+        while i < len(tokens) and tokens[i] == 'or':
+            right, i = conjunction(i + 1)
+            value = value or right
+        return value, i
+
+    def conjunction(i):
+        value, i = negation(i)
+        while i < len(tokens) and tokens[i] == 'and':
+            right, i = negation(i + 1)
+            value = value and right
+        return value, i
+
+    def negation(i):
+        if i < len(tokens) and tokens[i] == 'not':
+            value, i = negation(i + 1)
+            return not value, i
+        return operand(i)
+
+    def operand(i):
+        if i >= len(tokens):
+            raise ValueError('Unexpected end of JQL')
+        if tokens[i] == '(':
+            value, i = disjunction(i + 1)
+            if i >= len(tokens) or tokens[i] != ')':
+                raise ValueError('Missing closing parenthesis in JQL')
+            return value, i + 1
+        if tokens[i].startswith('_') and int(tokens[i][1:]) < len(values):
+            return values[int(tokens[i][1:])], i + 1
+        raise ValueError('Unexpected {} in JQL'.format(tokens[i]))
+
+    value, i = disjunction(0)
+    if i != len(tokens):
+        raise ValueError('Unexpected {} in JQL'.format(tokens[i]))
+    return value
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, body=None):
+        data = json.dumps(body).encode() if body is not None else b''
+        self.server.stats['requests'] += 1
+        self.server.stats['bytes'] += len(data)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length).decode() or '{}')
+
+    def _route(self, method):
+        time.sleep(self.server.latency)
+        url = urlparse(self.path)
+        query = {k: ','.join(v) for k, v in parse_qs(url.query).items()}
+        path = re.sub(r'^/rest/api/(2|latest)/', '', url.path)
+        data = self.server.dataset
+        issue_match = re.match(r'^issue/([^/]+)(/transitions|/assignee)?$', path)
+        with data.lock:
+            if path == 'serverInfo':
+                return self._reply(200, {'versionNumbers': [7, 0, 0], 'deploymentType': 'Server'})
+            if path == 'field':
+                return self._reply(200, [])
+            if path == 'search':
+                jql = query.get('jql', '')
+                start_at, max_results = int(query.get('startAt', 0)), int(query.get('maxResults', 50))
+                try:
+                    found = sorted((i for i in data.issues.values() if data.matches(i, jql)),
+                                   key=lambda i: -int(i['key'].split('-')[1]))
+                except ValueError as e:
+                    return self._reply(400, {'errorMessages': [str(e)]})
+                page = found[start_at:start_at + max_results]
+                return self._reply(200, {
+                    'startAt': start_at, 'maxResults': max_results, 'total': len(found),
+                    'issues': [data.to_json(i, query.get('fields')) for i in page]})
+            if path == 'issue' and method == 'POST':
+                fields = self._body()['fields']
+                type = [t for t, n in TYPES.items() if n == fields['issuetype']['name']][0]
+                parent = fields.get('parent', {}).get('key')
+                issue = data.add(type, fields['summary'], parent=parent)
+                return self._reply(201, {'id': issue['key'].split('-')[1], 'key': issue['key'],
+                                         'self': 'http://jira/rest/api/2/issue/' + issue['key']})
+            if issue_match:
+                key, sub = issue_match.groups()
+                issue = data.issues.get(key)
+                if issue is None:
+                    return self._reply(404, {'errorMessages': ['Issue does not exist']})
+                if sub is None:
+                    return self._reply(200, data.to_json(issue, query.get('fields')))
+                if sub == '/assignee':
+                    self._body()
+                    return self._reply(204)
+                transitions = TRANSITIONS[issue['status']]
+                if method == 'GET':
+                    return self._reply(200, {'transitions': [
+                        {'id': i, 'name': n, 'to': {'name': t}} for i, n, t in transitions]})
+                transition_id = str(self._body()['transition']['id'])
+                for i, n, t in transitions:
+                    if i == transition_id:
+                        issue['status'] = t
+                        issue['updated'] = data.tick()
+                        issue['mtime'] = time.time()
+                        return self._reply(204)
+                return self._reply(400, {'errorMessages': ['Invalid transition']})
+        self._reply(404, {'errorMessages': ['Not found']})
+
+    def do_GET(self):
+        self._route('GET')
+
+    def do_POST(self):
+        self._route('POST')
+
+    def do_PUT(self):
+        self._route('PUT')
+
+
+class FakeJira(ThreadingMixIn, HTTPServer):
+    """Threaded HTTP server emulating Jira."""
+    daemon_threads = True
+
+    def __init__(self, dataset, latency=0.0, port=0):
+        HTTPServer.__init__(self, ('127.0.0.1', port), Handler)
+        self.dataset = dataset
+        self.latency = latency
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = {'requests': 0, 'bytes': 0}
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}'.format(self.server_address[1])
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+
+if __name__ == '__main__':
+    import sys
+    server = FakeJira(Dataset(stories=int(sys.argv[2]) if len(sys.argv) > 2 else 10),
+                      port=int(sys.argv[1]) if len(sys.argv) > 1 else 8089)
+    print(server.url)
+    server.serve_forever()
@@ -0,0 +1,65 @@
+"""
+Measure memory used by local issue models.
+
+Builds 50k issues (stories with subtasks, as loaded from storage) with the
+current `JiraIssue` and with the previous `__dict__` based model and compares
+memory reported by tracemalloc.
+
+    python benchmarks/models_memory.py
+"""
+import gc
+import tracemalloc
+
+from jira_git_flow.models import JiraIssue
+
+ISSUES = 50000
+SUBTASKS_PER_STORY = 4
+
+
+class LegacyJiraIssue(object):
+    """Model as it was before `__slots__`."""
+    def __init__(self, key, summary, type, status, subtasks=[]):
+        self.key = key
+        self.summary = summary
+        self.type = type
+        self.status = status
+        self.subtasks = subtasks
+        self.full_name = self.__repr__()
+
+    def __eq__(self, obj):
+        return self.key == obj.key
+
+    def __repr__(self):
+        return '{}: {}'.format(self.key, self.summary)
+
+
+def build(model):
+    stories = []
+    for i in range(0, ISSUES, SUBTASKS_PER_STORY + 1):
+        subtasks = [model('PRJ-{}'.format(i + j), 'Feature number {}'.format(i + j), 'feature', 'open', [])
+                    for j in range(1, SUBTASKS_PER_STORY + 1)]
+        stories.append(model('PRJ-{}'.format(i), 'Story number {}'.format(i), 'story', 'in_progress', subtasks))
+    return stories
+
+
+def measure(model):
+    gc.collect()
+    tracemalloc.start()
+    stories = build(model)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del stories
+    return size
+
+
+def main():
+    legacy = measure(LegacyJiraIssue)
+    current = measure(JiraIssue)
+    print('{:<10} {:>12} {:>16}'.format('model', 'total [MB]', 'per issue [B]'))
+    for name, size in [('legacy', legacy), ('current', current)]:
+        print('{:<10} {:>12.1f} {:>16.0f}'.format(name, size / 2 ** 20, size / ISSUES))
+    print('saved {:.0%}'.format(1 - current / legacy))
+
+
+if __name__ == '__main__':
+    main()
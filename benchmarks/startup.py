@@ -0,0 +1,157 @@
+"""
+Measure wall time of CLI commands.
+
+Every command is run as a separate `git-flow` process in pseudo-terminal
+against local fake Jira server (`jira_server.FakeJira`, without latency) in
+temporary HOME and git repository, prompts and interactive choosers are
+answered as soon as they show up. The scenario is repeated `--repeat` times
+from the same data, the fastest run of every command is checked against
+its budget. The slowest modules reported by `python -X importtime` in the
+first, untimed round are listed for commands over budget. Exits with
+non-zero status when any budget is exceeded.
+
+    python benchmarks/startup.py
+"""
+import fcntl
+import os
+import pty
+import re
+import struct
+import subprocess
+import sys
+import tempfile
+import termios
+import time
+
+import click
+
+from commands import Environment
+from jira_server import Dataset, FakeJira
+
+RUN = 'from jira_git_flow import main; main()'
+CHOOSE = ('Choose issues', ' \r')
+CURSOR_POSITION_REQUEST = b'\x1b[6n'
+
+# (command, arguments, (expected output, answer) pairs, budget in milliseconds)
+# Budgets are about 1.5 times the fastest of repeated runs on a developer machine.
+SCENARIO = [
+    ('sync -f', ['sync', '-f'], [], 1000),
+    ('sync', ['sync'], [], 1000),
+    ('index', ['index'], [], 950),
+    ('workon', ['workon', '{keyword}'], [], 300),
+    ('status', ['status'], [], 500),
+    ('start', ['start'], [CHOOSE], 1400),
+    ('feature', ['feature'], [('summary', 'Benchmark feature\r\r')], 1400),
+    ('bug', ['bug'], [('summary', 'Benchmark bug\r\r')], 1300),
+    ('commit', ['commit', 'Benchmark'], [], 300),
+    ('publish', ['publish'], [], 400),
+    ('review', ['review', '-s'], [CHOOSE], 1450),
+    ('resolve', ['resolve'], [CHOOSE], 1450),
+    ('finish', ['finish'], [CHOOSE, ('Choose issues', '\r')], 550),
+]
+SLOWEST = 5
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$')
+
+
+def run(argv, environment, answers, python_options=()):
+    """Run git-flow in pseudo-terminal, return seconds, output and stderr."""
+    master, slave = pty.openpty()
+    fcntl.ioctl(slave, termios.TIOCSWINSZ, struct.pack('HHHH', 40, 120, 0, 0))
+    answers = list(answers)
+    output, answered = b'', 0
+    with tempfile.TemporaryFile() as errors:
+        start = time.perf_counter()
+        process = subprocess.Popen([sys.executable] + list(python_options) + ['-c', RUN] + argv,
+                                   cwd=environment.repo, env=environment.env,
+                                   stdin=slave, stdout=slave, stderr=errors)
+        os.close(slave)
+        while True:
+            try:
+                chunk = os.read(master, 65536)
+            except OSError:
+                # Terminal is closed when the process exits.
+                break
+            if not chunk:
+                break
+            output += chunk
+            if CURSOR_POSITION_REQUEST in chunk:
+                os.write(master, b'\x1b[1;1R')
+            if answers and answers[0][0].encode() in output[answered:]:
+                prompt, answer = answers.pop(0)
+                answered = output.index(prompt.encode(), answered) + len(prompt)
+                os.write(master, answer.encode())
+        process.wait()
+        seconds = time.perf_counter() - start
+        os.close(master)
+        errors.seek(0)
+        stderr = errors.read().decode('utf-8', 'replace')
+    if process.returncode:
+        raise RuntimeError('git-flow {} failed:\n{}{}'.format(
+            ' '.join(argv), output.decode('utf-8', 'replace'), stderr))
+    return seconds, stderr
+
+
+def slowest_modules(importtime_output):
+    entries = []
+    for line in importtime_output.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            entries.append((int(match.group(1)), match.group(4)))
+    return sorted(entries, reverse=True)[:SLOWEST]
+
+
+def run_scenario(environment, server, stories, python_options=()):
+    """Run all commands from fresh data, return {command: (seconds, stderr)}."""
+    dataset = server.dataset = Dataset(stories=stories)
+    environment.reset(dataset)
+    keyword = [issue for issue in dataset.issues.values() if issue['type'] == 'story'][-1]['summary']
+    tracked = os.path.join(environment.repo, 'tracked.txt')
+    results = {}
+    for name, argv, answers, _ in SCENARIO:
+        if name == 'commit':
+            with open(tracked, 'a') as f:
+                f.write('change\n')
+        argv = [arg.format(keyword=keyword) for arg in argv]
+        results[name] = run(argv, environment, answers, python_options)
+    return results
+
+
+@click.command()
+@click.option('--stories', default=20, help='Number of stories in Jira and local data.')
+@click.option('--repeat', default=5, help='Number of timed runs of the scenario.')
+def main(stories, repeat):
+    server = FakeJira(Dataset(stories=0)).start()
+    environment = Environment(server)
+    try:
+        tracked = os.path.join(environment.repo, 'tracked.txt')
+        with open(tracked, 'w') as f:
+            f.write('tracked\n')
+        subprocess.check_call(['git', 'add', 'tracked.txt'], cwd=environment.repo)
+        subprocess.check_call(['git', 'commit', '-q', '-m', 'Tracked file'], cwd=environment.repo)
+
+        # The first round warms up caches and reports imports.
+        imports = {name: stderr for name, (_, stderr)
+                   in run_scenario(environment, server, stories, ['-X', 'importtime']).items()}
+        fastest = {}
+        for _ in range(repeat):
+            for name, (seconds, _) in run_scenario(environment, server, stories).items():
+                fastest[name] = min(seconds, fastest.get(name, seconds))
+    finally:
+        environment.remove()
+        server.shutdown()
+
+    over_budget = False
+    print('{:<10} {:>10} {:>10}'.format('command', 'time [ms]', 'budget'))
+    for name, _, _, budget in SCENARIO:
+        elapsed = fastest[name] * 1000
+        print('{:<10} {:>10.1f} {:>10}'.format(name, elapsed, budget))
+        if elapsed > budget:
+            over_budget = True
+            for self_time, module in slowest_modules(imports[name]):
+                print('    {:>8.1f} ms  {}'.format(self_time / 1000, module))
+    if over_budget:
+        sys.exit('Startup budget exceeded.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Measure local storage load and save time.
+
+Generates data files with 1k and 10k issues and loads them with the fast
+decoder and with marshmallow validation (`git-flow --validate`).
+
+    python benchmarks/storage_load.py
+"""
+import json
+import os
+import tempfile
+import time
+
+from jira_git_flow.storage import Storage
+
+SIZES = [1000, 10000]
+SUBTASKS_PER_STORY = 4
+REPEAT = 5
+
+
+def generate(file, issues):
+    stories = []
+    for i in range(0, issues, SUBTASKS_PER_STORY + 1):
+        stories.append({
+            'key': 'PRJ-{}'.format(i), 'summary': 'Story number {}'.format(i),
+            'type': 'story', 'status': 'in_progress',
+            'subtasks': [{'key': 'PRJ-{}'.format(i + j), 'summary': 'Feature number {}'.format(i + j),
+                          'type': 'feature', 'status': 'open'} for j in range(1, SUBTASKS_PER_STORY + 1)]
+        })
+    with open(file, 'w') as f:
+        json.dump({'current_story': None, 'current_issue': None, 'stories': stories, 'last_sync': None}, f)
+
+
+def best_of(function):
+    times = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    print('{:>8} {:>12} {:>14} {:>12}'.format('issues', 'load [ms]', 'validate [ms]', 'save [ms]'))
+    for size in SIZES:
+        file = os.path.join(directory, 'data-{}.json'.format(size))
+        generate(file, size)
+        load = best_of(lambda: Storage(file).data)
+        validate = best_of(lambda: Storage(file, validate=True).data)
+        storage = Storage(file)
+        storage.data
+        save = best_of(storage._write_data)
+        print('{:>8} {:>12.1f} {:>14.1f} {:>12.1f}'.format(size, load * 1000, validate * 1000, save * 1000))
+
+
+if __name__ == '__main__':
+    main()
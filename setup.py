@@ -41,7 +41,7 @@ setup(
     test_suite='tests',
     entry_points={
         'console_scripts': [
-            'git-flow = jira_git_flow:git_flow',
+            'git-flow = jira_git_flow:main',
         ],
     },
 )
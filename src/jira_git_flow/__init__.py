@@ -1,27 +1,62 @@
+import sys
+import time
+from functools import lru_cache
+from itertools import islice
+
 import click
 from jira_git_flow import config
 from jira_git_flow import git
-from jira_git_flow.jira_api import Jira
-from jira_git_flow import cli
+from jira_git_flow.cache import TransitionCache
+from jira_git_flow.index import IssueIndex
 from jira_git_flow.models import JiraIssue
+from jira_git_flow.offline import action_queue
+from jira_git_flow.stats import Stats
 from jira_git_flow.storage import storage
-from jira_git_flow.util import generate_branch_name
+from jira_git_flow.tracing import tracer
+from jira_git_flow.util import generate_branch_name, get_flatten_issues
+
+# Modules with heavy dependencies (`jira_api` - jira and requests, `cli` -
+# prompt_toolkit) are imported by the functions which use them, so that
+# git-only commands start fast. See benchmarks/startup.py.
 
 
 @click.group(name="git-flow")
-def git_flow():
+@click.option('--validate', is_flag=True, help='Validate local data when loading it.')
+@click.option('--trace', is_flag=True, help='Print time spent in Jira, git and storage.')
+@click.option('--trace-output', type=click.Path(dir_okay=False),
+              help='Write Chrome trace-event JSON to file.')
+@click.option('--async', 'async_', is_flag=True,
+              help='Queue Jira status changes, replay them with `flush`.')
+@click.pass_context
+def git_flow(ctx, validate, trace, trace_output, async_):
     """Git flow."""
+    # Spans are always recorded for `git-flow doctor` statistics.
+    tracer.enable()
+    storage.validate = validate
+    action_queue.enabled = async_
+    action_queue.replayed = False
+    if ctx.invoked_subcommand == 'daemon':
+        # Served commands run the group on their own.
+        return
+    # Save storage once, when command ends.
+    storage.begin()
+    ctx.call_on_close(storage.commit)
+    if ctx.invoked_subcommand != 'doctor':
+        ctx.call_on_close(lambda: _record_stats(ctx.invoked_subcommand))
+    if trace or trace_output:
+        ctx.call_on_close(lambda: _report_trace(trace, trace_output))
 
 
 @git_flow.command()
 @click.option('-k', '--key', is_flag=True)
+@click.option('-r', '--remote', is_flag=True, help='Search Jira instead of local index.')
 @click.argument('keyword', nargs=-1, type=str)
-def workon(key, keyword):
+def workon(key, remote, keyword):
     """Work on story/issue."""
     if not keyword:
         issue = work_on_task()
     else:
-        issue = get_issue_from_jira(key, keyword, 'story')
+        issue = get_issue_from_jira(key, keyword, 'story', remote)
         storage.add_issue(issue)
     click.echo('Working on {}'.format(issue))
 
@@ -57,17 +92,12 @@ def review(skip_pr):
     action = 'review'
     issues = _get_issues_by_action(action)
 
-    if config.CREATE_PULL_REQUEST:
-        for issue in issues:
-            skip_issue_pr = skip_pr or (issue.type == 'story')
-            if not skip_issue_pr:
-                branch = generate_branch_name(issue)
-                git.push(branch)
-                git.create_pull_request(branch)
+    branches = {}
+    if config.CREATE_PULL_REQUEST and not skip_pr:
+        branches = {issue: generate_branch_name(issue) for issue in issues if issue.type != 'story'}
 
     jira = connect()
-    for issue in issues:
-        _make_action(jira, issue, action)
+    _make_actions(jira, issues, action, branches)
 
 
 @git_flow.command()
@@ -88,12 +118,15 @@ def commit(message):
 def publish():
     """Push branch to origin"""
     branch = generate_branch_name(storage.get_current_issue())
-    git.push(branch)
+    error = git.push(branch).get(branch)
+    if error:
+        exit('Failed to push {}: {}'.format(branch, error))
 
 
 @git_flow.command()
 def finish():
     """Finish story"""
+    from jira_git_flow import cli
     stories = cli.choose_by_types('story')
     for story in stories:
         storage.finish(story)
@@ -109,6 +142,7 @@ def finish():
 @git_flow.command()
 def status():
     """Get work status"""
+    from jira_git_flow import cli
     click.echo("You're working on story: {}".format(storage.get_current_story()))
     click.echo("You're working on issue: {}".format(storage.get_current_issue()))
     click.echo("Stories:")
@@ -116,15 +150,123 @@ def status():
 
 
 @git_flow.command()
-def sync():
+@click.option('-f', '--full', is_flag=True, help='Download all stories instead of changed ones.')
+def sync(full):
     """Sync stories between Jira and local storage"""
     jira = connect()
-    remote_stories = [jira.get_issue_by_key(story.key) for story in storage.get_stories()]
-    storage.sync(remote_stories)
+    keys = [story.key for story in storage.get_stories()]
+    synced_at = time.time()
+    last_sync = storage.get_last_sync()
+
+    if full or last_sync is None:
+        remote_stories = jira.get_issues_by_keys(keys)
+        storage.sync(remote_stories, synced_at)
+        _index_issues(get_flatten_issues(storage.get_stories()))
+        click.echo('Synced {} stories in {} Jira requests.'.format(
+            len(remote_stories), _jira_requests()))
+        return
+
+    # Relative JQL dates do not depend on Jira user's timezone,
+    # extra minute covers rounding down and Jira clock skew.
+    minutes = int((synced_at - last_sync) // 60) + 2
+    stories, subtasks = _split_updated_issues(jira.get_updated_issues(keys, minutes), keys)
+    storage.merge(stories, subtasks, synced_at)
+    _index_issues(stories + [subtask for _, subtask in subtasks])
+    click.echo('Synced {} changed issues in {} Jira requests.'.format(
+        len(stories) + len(subtasks), _jira_requests()))
+
+
+def _split_updated_issues(issues, keys):
+    """
+    Split Jira issues into tracked stories and (parent key, subtask) pairs.
+
+    Stories are recognized by tracked keys, as stories in epics have parent
+    as well.
+    """
+    tracked = set(keys)
+    stories, subtasks = [], []
+    for issue in issues:
+        if issue.key in tracked:
+            stories.append(JiraIssue.from_issue(issue))
+        else:
+            subtasks.append((issue.fields.parent.key, JiraIssue.from_issue(issue)))
+    return stories, subtasks
+
+
+@git_flow.command()
+def index():
+    """Index project issues for offline search"""
+    jira = connect()
+    issues = [JiraIssue.from_issue(issue) for issue in jira.get_project_issues()]
+    _index_issues(issues)
+    click.echo('Indexed {} issues in {} Jira requests.'.format(len(issues), _jira_requests()))
+
+
+@git_flow.command()
+def daemon():
+    """Serve commands from background process"""
+    from jira_git_flow.daemon import SERVED_COMMANDS, serve
+    # Import Jira client now, session is kept between commands.
+    _create_jira()
+    greeting = 'Serving {} and workon -k on {}.'.format(
+        ', '.join(sorted(SERVED_COMMANDS)), config.DAEMON_SOCKET)
+    try:
+        serve(config.DAEMON_SOCKET, _serve_command, greeting)
+    except KeyboardInterrupt:
+        click.echo('Daemon stopped.')
+
+
+def _serve_command(argv):
+    storage.reload_if_changed()
+    issue_index().reload_if_changed()
+    git_flow.main(argv, prog_name='git-flow')
+
+
+@git_flow.command()
+def flush():
+    """Replay queued Jira actions"""
+    if not action_queue:
+        click.echo('No queued actions.')
+        return
+    action_queue.enabled = False
+    # Connecting replays the queue.
+    connect()
+    left = len(action_queue.load())
+    if left:
+        exit('{} action(s) left in queue.'.format(left))
+
+
+@git_flow.command()
+@click.option('-n', '--runs', type=int, help='Number of the latest runs to report.')
+def doctor(runs):
+    """Report latency and cache statistics"""
+    stats = Stats(config.STATS_FILE, config.STATS_RUNS)
+    recorded = stats.load()[-runs:] if runs else stats.load()
+    if not recorded:
+        exit('No statistics recorded yet.')
+    click.echo('Statistics of the last {} runs since {}.'.format(
+        len(recorded), time.strftime('%Y-%m-%d %H:%M', time.localtime(recorded[0]['time']))))
+
+    click.echo('\n{:<36} {:>7} {:>9} {:>9} {:>9}'.format(
+        'call', 'calls', 'p50 ms', 'p95 ms', 'p99 ms'))
+    for name, calls, p50, p95, p99 in stats.latencies(recorded):
+        click.echo('{:<36} {:>7} {:>9.1f} {:>9.1f} {:>9.1f}'.format(name, calls, p50, p95, p99))
+
+    counters = stats.counters(recorded)
+    click.echo('\n{:<36} {:>7} {:>9}'.format('cache', 'hits', 'ratio'))
+    for cache in ['transitions cache', 'index', 'git context']:
+        hits, misses = counters.get(cache + ' hits', 0), counters.get(cache + ' misses', 0)
+        if hits + misses:
+            click.echo('{:<36} {:>7} {:>8.0%}'.format(cache, hits, hits / (hits + misses)))
+
+    click.echo('\n{:<36} {:>7} {:>9} {:>9}'.format('command', 'runs', 'requests', 'seconds'))
+    for command, count, requests_count, seconds in stats.commands(recorded):
+        click.echo('{:<36} {:>7} {:>9.1f} {:>9.2f}'.format(command, count, requests_count, seconds))
 
 
 def work_on_task():
     """Work on task from local storage."""
+    from jira_git_flow import cli
     issue = cli.choose_issue()
     if not issue:
         exit('Select issue!')
@@ -144,15 +286,17 @@ def checkout_branch(issue):
 
 def create_issue(type, subtask, start_progress=True):
     """Create Jira issue and return model."""
+    from jira_git_flow import cli
     fields = cli.get_issue_fields(type, subtask)
 
     jira = connect()
     issue = JiraIssue.from_issue(jira.create_issue(fields))
 
     if start_progress:
-        _make_action(jira, issue, 'start_progress')
+        _make_actions(jira, [issue], 'start_progress')
 
     storage.add_issue(issue)
+    _index_issues([issue])
 
     return issue
 
@@ -163,79 +307,277 @@ def create_subtask(type):
     checkout_branch(subtask)
 
 
-def get_issue_from_jira(is_key, keyword, type):
+def get_issue_from_jira(is_key, keyword, type, remote=False):
     """
     Get issue from Jira.
 
     Issue can be searched by the keyword or specified via issue key.
+    Keyword is looked up in local index first, Jira is searched only when
+    nothing matches locally or when `remote` is set. Issue found in index is
+    returned without connecting to Jira, with status of the last indexing.
     Return internal issue model.
     """
-    jira = connect()
     keyword = ' '.join(keyword)
     if is_key:
-        issue = jira.get_issue_by_key(keyword)
+        issue = JiraIssue.from_issue(connect().get_issue_by_key(keyword))
     else:
-        issues = jira.search_issues(keyword, type=type)
+        issues = [] if remote else issue_index().search(keyword, type=type)
+        if not remote:
+            tracer.count('index hits' if issues else 'index misses')
+        if not issues:
+            found = islice(connect().search_issues(keyword, type=type), config.MAX_RESULTS)
+            issues = [JiraIssue.from_issue(issue) for issue in found]
+            _index_issues(issues)
         if not issues:
             exit('No issues found with selected keyword: {}!'.format(keyword))
         elif len(issues) > 1:
+            from jira_git_flow import cli
             issue = cli.choose_issues_from_simple_view(issues)
         else:
             issue = issues[0]
 
-    return JiraIssue.from_issue(issue)
+    _index_issues([issue])
+    return issue
 
 
 def _get_issues_by_action(action):
+    from jira_git_flow import cli
     status = _get_action_status(action)
     issues = cli.choose_by_status(status)
     return issues
 
 
-def _change_status(action, issues=None):
+def _change_status(action):
     issues = _get_issues_by_action(action)
     jira = connect()
-    for issue in issues:
-        _make_action(jira, issue, action)
+    _make_actions(jira, issues, action)
 
 
-def _make_action(jira, issue, action_to_perform):
-    action = _get_issue_actions(issue)[action_to_perform]
-    issue.status = action['next_state']
-    jira_issue = jira.get_issue_by_key(issue.key)
+def _make_actions(jira, issues, action_to_perform, branches=None):
+    """
+    Perform action on issues in a pipeline.
+
+    Issues with `branches` have them pushed with a single git push and pull
+    requests opened. Then issues are transitioned and assigned in Jira by up
+    to `config.CONCURRENCY` workers per stage, or the Jira calls are queued
+    when `action_queue` is enabled. Stages of different issues overlap.
+    Failed issues are reported after the whole batch, issues failed before
+    their transition keep their local status. Storage is saved once.
+    """
+    from jira_git_flow.pipeline import Pipeline, Stage
+    branches = branches or {}
+    actions = {issue: _get_issue_actions(issue)[action_to_perform] for issue in issues}
+    warnings = []
+
+    def push(batch):
+        to_push = [branches[issue] for issue in batch if issue in branches]
+        errors = git.push(*to_push) if to_push else {}
+        return {issue: errors[branches[issue]] for issue in batch if branches.get(issue) in errors}
+
+    def create_pull_request(issue):
+        if issue in branches:
+            try:
+                git.create_pull_request(branches[issue])
+            except ValueError as e:
+                warnings.append('{} - pull request not created: {}'.format(issue, e))
+
+    stages = []
+    if branches:
+        stages += [Stage('push', push, batch=True), Stage('pull request', create_pull_request)]
+    if action_queue.enabled:
+        stages.append(Stage('queue',
+                            lambda issue: _queue_action(issue, action_to_perform, actions[issue])))
+    else:
+        stages += [
+            Stage('transition', lambda issue: _transition_issue(jira, issue, actions[issue]),
+                  workers=config.CONCURRENCY),
+            Stage('assign', lambda issue: _assign_issue(jira, issue.key, actions[issue]),
+                  workers=config.CONCURRENCY),
+        ]
+    done, failed = Pipeline(stages).run(issues)
+
+    for warning in warnings:
+        click.echo(warning, err=True)
+    for issue, stage, error in failed:
+        click.echo('{} - {} failed at {}: {}'.format(issue, action_to_perform, stage, error),
+                   err=True)
+    transitioned = done + [issue for issue, stage, _ in failed if stage == 'assign']
+    for issue in transitioned:
+        issue.status = actions[issue]['next_state']
+    for issue in done:
+        click.echo('{} - {}{}'.format(issue, action_to_perform,
+                                      ' queued' if action_queue.enabled else ''))
+
+    storage.update_issues(transitioned)
+    if failed:
+        exit('Failed to {} {} issue(s).'.format(action_to_perform, len(failed)))
+
+
+def _transition_issue(jira, issue, action):
+    state = (issue.type, action['current_state'])
     for transition in action['transitions']:
-        jira.transition_issue(jira_issue, transition)
-    _assign_issue(jira, jira_issue, action)
-    storage.update_issue(issue)
-    click.echo('{} - {}'.format(issue, action_to_perform))
+        jira.transition_issue(issue.key, transition, state)
+
+
+def _queue_action(issue, action_name, action):
+    assignee = config.USERNAME if action.get('assign_to_user') else None
+    action_queue.append(issue, action_name, action, assignee)
+    tracer.count('queued actions')
+
+
+def _flush_queue(jira):
+    """
+    Replay queued actions.
+
+    Current statuses of queued issues are fetched at once. Actions of an issue
+    are replayed in order: action is skipped when issue is already in its next
+    state, action and the following actions of the issue are dropped when
+    issue is in other state than expected. Actions failed on Jira error stay
+    in queue. Stored issues get their Jira status.
+    """
+    from jira_git_flow.pipeline import Pipeline, Stage
+    entries = action_queue.load()
+    if not entries:
+        return
+    chains = {}
+    for entry in entries:
+        chains.setdefault(entry['key'], []).append(entry)
+    try:
+        remote = {issue.key: JiraIssue.from_issue(issue)
+                  for issue in jira.get_issues_by_keys(list(chains))}
+    except Exception as e:
+        click.echo('Jira is not available, {} action(s) stay queued: {}'.format(
+            len(entries), e), err=True)
+        return
+
+    replayed, skipped, conflicts, left = [], [], [], {}
+
+    def replay(key):
+        issue = remote.get(key)
+        if issue is None:
+            conflicts.append('{} - issue not found'.format(key))
+            return
+        for i, entry in enumerate(chains[key]):
+            if entry['transitions'] and issue.status == entry['next_state']:
+                skipped.append(entry)
+                continue
+            if issue.status != entry['current_state']:
+                conflicts.append('{} - {} expects {}, issue is {}'.format(
+                    issue, entry['action'], entry['current_state'], issue.status))
+                return
+            try:
+                _transition_issue(jira, issue, entry)
+            except Exception:
+                left[key] = chains[key][i:]
+                raise
+            issue.status = entry['next_state']
+            try:
+                jira.assign_issue(key, entry['assignee'])
+            except Exception:
+                # Keep the assignment only.
+                left[key] = ([dict(entry, transitions=[], current_state=entry['next_state'])]
+                             + chains[key][i + 1:])
+                raise
+            replayed.append(entry)
+
+    _, failed = Pipeline([Stage('replay', replay, workers=config.CONCURRENCY)]).run(list(chains))
+    for key, _, error in failed:
+        click.echo('{} - replay failed: {}'.format(key, error), err=True)
+    for conflict in conflicts:
+        click.echo('Conflict: {}, action dropped.'.format(conflict), err=True)
+
+    # Keep actions queued by other commands in the meantime.
+    kept = [entry for key in chains for entry in left.get(key, [])]
+    action_queue.replace(kept + action_queue.load()[len(entries):])
+    # Stories replace stored subtasks with ones fetched before replay, so
+    # replayed subtasks are stored after them.
+    storage.update_issues(sorted(remote.values(), key=lambda issue: issue.type != 'story'))
+    click.echo('Replayed {} queued action(s), {} already applied, {} conflict(s), {} left.'.format(
+        len(replayed), len(skipped), len(conflicts), len(kept)))
 
 
 def _get_issue_actions(issue):
-    default_actions = config.ACTIONS['default']
-    if issue.type in config.ACTIONS:
-        actions = default_actions
-        for action, parameters in config.ACTIONS[issue.type].items():
-            for parameter, value in parameters.items():
-                actions[action][parameter] = value
-        return {k: v for k, v in actions.items() if k in config.ACTIONS[issue.type]}
-    return default_actions
+    return config.ISSUE_ACTIONS.get(issue.type, config.ISSUE_ACTIONS['default'])
 
 
 def _get_action_status(action):
-    return config.ACTIONS['default'][action]['current_state']
+    return config.ISSUE_ACTIONS['default'][action]['current_state']
 
 
-def _assign_issue(jira, jira_issue, action):
+def _assign_issue(jira, issue_key, action):
     if 'assign_to_user' in action and action['assign_to_user']:
-        jira.assign_issue(jira_issue, config.USERNAME)
+        jira.assign_issue(issue_key, config.USERNAME)
     else:
-        jira.assign_issue(jira_issue, None)
+        jira.assign_issue(issue_key, None)
+
+
+@lru_cache(maxsize=None)
+def issue_index():
+    """Return local issues index."""
+    return IssueIndex(config.INDEX_FILE)
+
+
+def _index_issues(issues):
+    index = issue_index()
+    index.add(issues)
+    index.save()
+
+
+def _jira_requests():
+    """Number of Jira requests made by the current command."""
+    return tracer.counters.get('jira requests', 0)
+
+
+def _record_stats(command):
+    try:
+        Stats(config.STATS_FILE, config.STATS_RUNS).record(command, tracer)
+    except OSError as e:
+        click.echo('Failed to save statistics: {}'.format(e), err=True)
+
+
+def _report_trace(summary, output):
+    if summary:
+        tracer.print_summary()
+    if output:
+        tracer.write_chrome_trace(output)
+        click.echo('Trace written to {}.'.format(output), err=True)
 
 
 def connect():
-    """Connect to JIRA and return Jira instance."""
-    return Jira(config.URL, config.EMAIL, config.TOKEN, config.PROJECT, config.MAX_RESULTS)
+    """
+    Return Jira instance shared by the whole process.
+
+    Connection to JIRA is made on the first request. Actions queued with
+    `--async` are replayed once per command, unless it runs with `--async`.
+    """
+    jira = _create_jira()
+    if action_queue and not action_queue.enabled and not action_queue.replayed:
+        action_queue.replayed = True
+        _flush_queue(jira)
+    return jira
+
+
+@lru_cache(maxsize=None)
+def _create_jira():
+    from jira_git_flow.jira_api import Jira
+    return Jira(config.URL, config.EMAIL, config.TOKEN, config.PROJECT, config.MAX_RESULTS,
+                # Transition and assign stages run concurrently, see _make_actions.
+                pool_size=max(2 * config.CONCURRENCY, 1), get_server_info=config.JIRA_SERVER_INFO,
+                transitions_cache=TransitionCache(config.TRANSITIONS_FILE,
+                                                  config.TRANSITIONS_CACHE_TTL),
+                extra_fields=config.EXTRA_FIELDS)
+
+
+def main():
+    """Run command in daemon when it is running, in this process otherwise."""
+    from jira_git_flow.daemon import is_served, run_remote
+    argv = sys.argv[1:]
+    if is_served(argv):
+        code = run_remote(config.DAEMON_SOCKET, argv)
+        if code is not None:
+            sys.exit(code)
+    git_flow(prog_name='git-flow')
 
 
 if __name__ == "__main__":
-    pass
+    main()
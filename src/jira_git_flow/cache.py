@@ -0,0 +1,52 @@
+"""Local caches of Jira metadata."""
+import json
+import threading
+import time
+
+from jira_git_flow.tracing import tracer
+from jira_git_flow.util import write_atomic
+
+
+class TransitionCache(object):
+    """
+    Transition ids stored in JSON file.
+
+    Ids are keyed by project, issue type, workflow status and transition name
+    and expire after `ttl` seconds.
+    """
+    def __init__(self, file, ttl):
+        self.file = file
+        self.ttl = ttl
+        self._entries = None
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._load().get(key)
+        if entry and time.time() - entry['time'] < self.ttl:
+            tracer.count('transitions cache hits')
+            return entry['id']
+        tracer.count('transitions cache misses')
+        return None
+
+    def set(self, key, transition_id):
+        with self._lock:
+            self._load()[key] = {'id': transition_id, 'time': time.time()}
+            self._save()
+
+    def invalidate(self, key):
+        with self._lock:
+            if self._load().pop(key, None):
+                self._save()
+
+    def _load(self):
+        if self._entries is None:
+            try:
+                with open(self.file, 'r') as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def _save(self):
+        write_atomic(self.file, json.dumps(self._entries))
@@ -4,10 +4,11 @@ import click
 from jira_git_flow import config
 from jira_git_flow.models import JiraIssue
 from jira_git_flow.storage import storage
+from jira_git_flow.util import get_flatten_issues
 
 from prompt_toolkit import print_formatted_text
 from prompt_toolkit.layout.screen import Point
-from prompt_toolkit.application import Application, get_app
+from prompt_toolkit.application import Application
 from prompt_toolkit.filters import IsDone
 from prompt_toolkit.formatted_text import FormattedText
 from prompt_toolkit.key_binding import KeyBindings
@@ -20,188 +21,163 @@ from prompt_toolkit.layout.dimension import LayoutDimension as D
 from prompt_toolkit.mouse_events import MouseEventType
 from prompt_toolkit.styles import Style
 
-
-from prompt_toolkit.cache import SimpleCache
-from prompt_toolkit.filters import to_filter
-from prompt_toolkit.formatted_text import to_formatted_text
-from prompt_toolkit.formatted_text.utils import split_lines, fragment_list_to_text
-from prompt_toolkit.utils import get_cwidth
-
 UNCHECKED = '\u25cb '
 CHECKED = '\u25cf '
 POINTER = ' \u276f '
 
 
-class DynamicFormattedTextControl(UIControl):
+class IssuesController(UIControl):
     """
-    Control that displays formatted text dynamically. This can be either plain
-    text, an :class:`~prompt_toolkit.formatted_text.HTML` object an
-    :class:`~prompt_toolkit.formatted_text.ANSI` object or a list of
-    ``(style_str, text)`` tuples, depending on how you prefer to do the
-    formatting. See ``prompt_toolkit.layout.formatted_text`` for more
-    information.
-
-    The get_text is callable which is dynamically returning text to render.
-    """
-    def __init__(self, get_text, style='', focusable=False, key_bindings=None,
-                 show_cursor=False, modal=False, get_cursor_position=None):
-        from prompt_toolkit.key_binding.key_bindings import KeyBindingsBase
-        assert key_bindings is None or isinstance(key_bindings, KeyBindingsBase)
-        assert isinstance(show_cursor, bool)
-        assert isinstance(modal, bool)
-        assert get_cursor_position is None or callable(get_cursor_position)
-
-        self.get_text = get_text
-        self.style = style
-        self.focusable = to_filter(focusable)
-
-        self.get_cursor_position = get_cursor_position
-
-        # Key bindings.
-        self.key_bindings = key_bindings
-        self.show_cursor = show_cursor
-        self.modal = modal
-
-        #: Cache for the content.
-        self._content_cache = SimpleCache(maxsize=18)
-        self._fragment_cache = SimpleCache(maxsize=1)
-        # Only cache one fragment list. We don't need the previous item.
-
-        # Render info for the mouse support.
-        self._fragments = None
-
-    def reset(self):
-        self._fragments = None
-
-    def is_focusable(self):
-        return self.focusable()
-
-    def __repr__(self):
-        return '%s(%r)' % (self.__class__.__name__, self.get_text())
-
-    def _get_formatted_text_cached(self):
-        """
-        Get fragments, but only retrieve fragments once during one render run.
-        (This function is called several times during one rendering, because
-        we also need those for calculating the dimensions.)
-        """
-        return self._fragment_cache.get(
-            get_app().render_counter,
-            lambda: to_formatted_text(self.get_text(), self.style))
-
-    def preferred_width(self, max_available_width):
-        """
-        Return the preferred width for this control.
-        That is the width of the longest line.
-        """
-        text = fragment_list_to_text(self._get_formatted_text_cached())
-        line_lengths = [get_cwidth(l) for l in text.split('\n')]
-        return max(line_lengths)
-
-    def preferred_height(self, width, max_available_height, wrap_lines, get_line_prefix):
-        content = self.create_content(width, None)
-        return content.line_count
-
-    def create_content(self, width, height):
-        # Get fragments
-        fragments_with_mouse_handlers = self._get_formatted_text_cached()
-        fragment_lines_with_mouse_handlers = list(split_lines(fragments_with_mouse_handlers))
-
-        # Strip mouse handlers from fragments.
-        fragment_lines = [
-            [tuple(item[:2]) for item in line]
-            for line in fragment_lines_with_mouse_handlers
-        ]
-
-        # Keep track of the fragments with mouse handler, for later use in
-        # `mouse_handler`.
-        self._fragments = fragments_with_mouse_handlers
-
-        cursor_position = self.get_cursor_position()
-
-        # Create content, or take it from the cache.
-        key = (tuple(fragments_with_mouse_handlers), width, cursor_position)
-
-        def get_content():
-            return UIContent(get_line=lambda i: fragment_lines[i],
-                             line_count=len(fragment_lines),
-                             cursor_position=cursor_position,
-                             show_cursor=self.show_cursor)
-
-        return self._content_cache.get(key, get_content)
-
-    def is_modal(self):
-        return self.modal
+    Choices list rendering only rows visible in window.
 
-    def get_key_bindings(self):
-        return self.key_bindings
+    Rendered rows are cached until pointer or selection of the row changes.
+    Selected issues are kept by key in order of selection.
 
-
-class IssuesController(DynamicFormattedTextControl):
+    Choices can be filtered by query matching lowercase issue key and summary
+    as a subsequence. Every typed character narrows choices matched by
+    previous query, searching each of them from the end of its previous
+    match. Erasing the character goes back to the previous choices.
+    While `searching`, all typed characters are added to query.
+    """
     def __init__(self, message, choices, pointer_index=0):
         self.message = message
         self.pointer_index = pointer_index
         self.answered = False
-        self.selected = []
+        self.selected = {}
+        self.query = ''
+        self.searching = False
+        self.working_key = get_working_key()
+        self._rows = {}
         self._init_choices(choices)
-        super(IssuesController, self).__init__(
-            self.get_formatted_choices,
-            show_cursor=False,
-            get_cursor_position=lambda: Point(1, self.pointer_index))
+        self._search_index = ['%s %s' % (issue.key.lower(), name.lower())
+                              for name, issue, _ in self.choices]
+        # Shown choices and ends of their matches for every prefix of query.
+        self._matches = [list(range(len(self.choices)))]
+        self._match_ends = [[0] * len(self.choices)]
+        self._show()
+
+    @property
+    def lines(self):
+        """Indexes of shown choices."""
+        return self._matches[-1]
 
     @property
     def line_count(self):
-        return len(self.choices)
+        return len(self.lines)
+
+    @property
+    def selected_issues(self):
+        return list(self.selected.values())
 
     def has_active_choices(self):
-        for choice in self.choices:
-            if not choice[2]:
-                return True
-        return False
+        return any(not choice[2] for choice in self.choices)
+
+    def preferred_height(self, width, max_available_height, wrap_lines, get_line_prefix):
+        return self.line_count
+
+    def create_content(self, width, height):
+        # Window asks only for lines it shows.
+        return UIContent(get_line=self.get_line,
+                         line_count=self.line_count,
+                         cursor_position=Point(1, self.pointer_line or 0),
+                         show_cursor=False)
+
+    def get_line(self, line):
+        index = self.lines[line]
+        row = self._rows.get(index)
+        if row is None:
+            row = self._rows[index] = self._render_row(index)
+        return row
 
     def mouse_handler(self, mouse_event):
         if mouse_event.event_type == MouseEventType.MOUSE_DOWN:
-            index = mouse_event.position.y
-            self.toggle(index)
+            line = mouse_event.position.y
+            if line < self.line_count:
+                self.toggle(self.lines[line])
 
     def toggle(self, index):
         pointed_choice = self.choices[index][1]
-        if pointed_choice in self.selected:
-            self.selected.remove(pointed_choice)
+        if pointed_choice.key in self.selected:
+            del self.selected[pointed_choice.key]
         else:
-            self.selected.append(pointed_choice)
+            self.selected[pointed_choice.key] = pointed_choice
+        self._rows.pop(index, None)
+
+    def move_pointer(self, line):
+        self._rows.pop(self.pointer_index, None)
+        self.pointer_line = line
+        self.pointer_index = None if line is None else self.lines[line]
+        self._rows.pop(self.pointer_index, None)
+
+    def move_down(self):
+        if self.pointer_line is not None:
+            self.move_pointer(self._next_enabled[self.pointer_line])
+
+    def move_up(self):
+        if self.pointer_line is not None:
+            self.move_pointer(self._prev_enabled[self.pointer_line])
+
+    def extend_query(self, text):
+        search_index = self._search_index
+        for char in text:
+            self.query += char
+            char = char.lower()
+            matches, match_ends = [], []
+            # The earliest match of query prefix leaves the most room for the rest.
+            for i, end in zip(self.lines, self._match_ends[-1]):
+                position = search_index[i].find(char, end)
+                if position >= 0:
+                    matches.append(i)
+                    match_ends.append(position + len(char))
+            self._matches.append(matches)
+            self._match_ends.append(match_ends)
+        self._show()
+
+    def erase(self):
+        if self.query:
+            self.query = self.query[:-1]
+            self._matches.pop()
+            self._match_ends.pop()
+            self._show()
+
+    def clear_query(self):
+        self.query = ''
+        self.searching = False
+        del self._matches[1:]
+        del self._match_ends[1:]
+        self._show()
 
     def get_formatted_choices(self):
         choices = []
-        for i, choice in enumerate(self.choices):
-            name = choice[0]
-            issue = choice[1]
-            selected = (issue in self.selected)
-            pointed_at = (i == self.pointer_index)
-
-            if issue.type != 'story':
-                choices.append(('class:default', '   '))
-
-            if pointed_at:
-                choices.append(('class:pointer', POINTER))
-            else:
-                choices.append(('class:default', '   '))
-
-            if choice[2]:  # disabled
-                choices.append(('class:default', '- '))
-            else:
-                if selected:
-                    choices.append(('class:sel_issue', CHECKED))
-                else:
-                    choices.append(('class:default', UNCHECKED))
-
-            choices.append(render_issue_key(issue))
-            choices.append(('class:default', ' %s' % name))
-            choices.append(render_badge(issue))
+        for line in range(self.line_count):
+            choices.extend(self.get_line(line))
             choices.append(('class:default', '\n'))
-
         return choices
 
+    def _render_row(self, index):
+        name, issue, disabled = self.choices[index]
+        row = []
+
+        if issue.type != 'story':
+            row.append(('class:default', '   '))
+
+        if index == self.pointer_index:
+            row.append(('class:pointer', POINTER))
+        else:
+            row.append(('class:default', '   '))
+
+        if disabled:
+            row.append(('class:default', '- '))
+        elif issue.key in self.selected:
+            row.append(('class:sel_issue', CHECKED))
+        else:
+            row.append(('class:default', UNCHECKED))
+
+        row.append(render_issue_key(issue, self.working_key))
+        row.append(('class:default', ' %s' % name))
+        row.append(render_badge(issue))
+        return row
+
     def _init_choices(self, choices):
         self.choices = []
         pointer_not_set = True if self.pointer_index == 0 else False
@@ -218,6 +194,32 @@ class IssuesController(DynamicFormattedTextControl):
 
             self.choices.append((name, issue, disabled))
 
+    def _show(self):
+        """Update moves between shown choices, keep pointer on its choice if it is still shown."""
+        lines = self.lines
+        count = len(lines)
+        enabled = [line for line, i in enumerate(lines) if not self.choices[i][2]]
+        self._next_enabled = list(range(count))
+        self._prev_enabled = list(range(count))
+        if not enabled:
+            self.move_pointer(None)
+            return
+
+        following = enabled[0]
+        for line in reversed(range(count)):
+            self._next_enabled[line] = following
+            if not self.choices[lines[line]][2]:
+                following = line
+
+        preceding = enabled[-1]
+        for line in range(count):
+            self._prev_enabled[line] = preceding
+            if not self.choices[lines[line]][2]:
+                preceding = line
+
+        pointer_line = next((line for line in enabled if lines[line] == self.pointer_index), None)
+        self.move_pointer(enabled[0] if pointer_line is None else pointer_line)
+
 
 def select_issue(choices, pointer_index):
     controller = IssuesController(message='choose issues', choices=choices,
@@ -228,12 +230,14 @@ def select_issue(choices, pointer_index):
 
         prompt.append(('class:qmark', '?'))
         prompt.append(('class:question', ' %s ' % 'Choose issues:'))
+        if controller.searching or controller.query:
+            prompt.append(('class:answer', '/' + controller.query))
 
         return prompt
 
     layout = Layout(HSplit([
         Window(height=D.exact(1),
-               content=FormattedTextControl(get_prompt(), show_cursor=False)),
+               content=FormattedTextControl(get_prompt, show_cursor=False)),
         ConditionalContainer(
             Window(
                 content=controller,
@@ -252,35 +256,67 @@ def select_issue(choices, pointer_index):
     def exit(event):
         event.app.exit(result=[])
 
+    # Navigation keys are typed into query while searching.
     @bindings.add(' ', eager=True)
     def toggle(event):
-        controller.toggle(controller.pointer_index)
+        if controller.searching:
+            controller.extend_query(event.data)
+        elif controller.pointer_index is not None:
+            controller.toggle(controller.pointer_index)
         event.app.invalidate()
 
     @bindings.add('j', eager=True)
     @bindings.add(Keys.Down, eager=True)
     def move_cursor_down(event):
-        def _next():
-            controller.pointer_index = ((controller.pointer_index + 1) % controller.line_count)
-            event.app.invalidate()
-        _next()
-        while controller.choices[controller.pointer_index][2]:
-            _next()
+        if controller.searching and event.data == 'j':
+            controller.extend_query(event.data)
+        else:
+            controller.move_down()
+        event.app.invalidate()
 
     @bindings.add(Keys.Up, eager=True)
     @bindings.add('k', eager=True)
     def move_cursor_up(event):
-        def _prev():
-            controller.pointer_index = ((controller.pointer_index - 1) % controller.line_count)
+        if controller.searching and event.data == 'k':
+            controller.extend_query(event.data)
+        else:
+            controller.move_up()
+        event.app.invalidate()
+
+    @bindings.add('/', eager=True)
+    def start_search(event):
+        if controller.searching:
+            controller.extend_query(event.data)
+        controller.searching = True
+        event.app.invalidate()
+
+    # Other keys with more specific bindings take precedence.
+    @bindings.add(Keys.Any)
+    def search(event):
+        if event.data.isprintable():
+            controller.searching = True
+            controller.extend_query(event.data)
             event.app.invalidate()
-        _prev()
-        while controller.choices[controller.pointer_index][2]:
-            _prev()
+
+    @bindings.add(Keys.Backspace, eager=True)
+    def erase(event):
+        controller.erase()
+        event.app.invalidate()
+
+    @bindings.add(Keys.Escape, eager=True)
+    def clear_query(event):
+        controller.clear_query()
+        event.app.invalidate()
 
     @bindings.add(Keys.Enter, eager=True)
     def set_answer(event):
+        if controller.searching:
+            # Keep filter, j/k and space navigate again.
+            controller.searching = False
+            event.app.invalidate()
+            return
         controller.answered = True
-        event.app.exit(result=controller.selected)
+        event.app.exit(result=controller.selected_issues)
 
     style = Style.from_dict({
         'separator': '#6C6C6C',
@@ -421,31 +457,15 @@ def get_pointer_index(stories):
     current_issue = storage.get_current_issue()
     current_story = storage.get_current_story()
 
+    positions = {issue.key: position for position, issue in enumerate(flatten_issues)}
     for current in [current_issue, current_story]:
-        if current:
-            try:
-                return flatten_issues.index(current)
-            except ValueError:
-                pass
+        if current and current.key in positions:
+            return positions[current.key]
     return 0
 
 
-def get_flatten_issues(stories):
-    flatten_issues = []
-    for story in stories:
-        flatten_issues.append(story)
-        flatten_issues.extend(story.subtasks)
-    return flatten_issues
-
-
-def render_issue_key(issue):
-    underline = ''
-    if storage.get_current_issue():
-        if working_on_issue(issue):
-            underline = 'underline'
-    else:
-        if working_on_story(issue):
-            underline = 'underline'
+def render_issue_key(issue, working_key):
+    underline = 'underline' if issue.key == working_key else ''
     return ('bold %s' % underline, issue.key)
 
 
@@ -455,15 +475,8 @@ def render_badge(issue):
     return ('fg: {color} bg:'.format(color=color), ' %s' % badge)
 
 
-def working_on_issue(issue):
-    current_issue = storage.get_current_issue()
-    if current_issue:
-        return issue == current_issue
-    return False
-
-
-def working_on_story(story):
-    current_story = storage.get_current_story()
-    if current_story:
-        return story == current_story
-    return False
+def get_working_key():
+    """Return key of current issue, or of current story when no issue is in progress."""
+    current = storage.get_current_issue() or storage.get_current_story()
+    if current:
+        return current.key
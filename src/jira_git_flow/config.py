@@ -1,10 +1,17 @@
 import json
 import os
+from types import MappingProxyType
 
 BASE_DIRECTORY = os.path.expanduser('~') + '/.config/jira-git-flow/'
 CREDENTIAL_FILE = BASE_DIRECTORY + 'credentials.json'
 CONFIG_FILE = BASE_DIRECTORY + 'config.json'
 DATA_FILE = BASE_DIRECTORY + 'data.json'
+DATABASE_FILE = BASE_DIRECTORY + 'data.sqlite'
+TRANSITIONS_FILE = BASE_DIRECTORY + 'transitions.json'
+INDEX_FILE = BASE_DIRECTORY + 'index.json'
+STATS_FILE = BASE_DIRECTORY + 'stats.json'
+QUEUE_FILE = BASE_DIRECTORY + 'queue.jsonl'
+DAEMON_SOCKET = BASE_DIRECTORY + 'daemon.sock'
 
 credentials = {
     'username': 'jira_username',
@@ -85,7 +92,13 @@ config = {
             'prefix': 'b/'
         }
     },
-    'create_pull_request': True
+    'create_pull_request': True,
+    'concurrency': 4,
+    'jira_server_info': False,
+    'transitions_cache_ttl': 86400,
+    'extra_fields': [],
+    'storage': 'json',
+    'stats_runs': 100
 }
 
 if not os.path.exists(BASE_DIRECTORY):
@@ -117,4 +130,42 @@ STATUSES = config['statuses']
 BADGES = config['badges']
 ISSUE_TYPES = config['types']
 CREATE_PULL_REQUEST = config['create_pull_request']
+CONCURRENCY = config.get('concurrency', 4)
+JIRA_SERVER_INFO = config.get('jira_server_info', False)
+TRANSITIONS_CACHE_TTL = config.get('transitions_cache_ttl', 86400)
+EXTRA_FIELDS = config.get('extra_fields', [])
+STORAGE = config.get('storage', 'json')
+STATS_RUNS = config.get('stats_runs', 100)
 MAX_RESULTS = 100
+
+
+def _compile_types(types):
+    """Map Jira issue type names to local types."""
+    return {value['name']: key for key, value in types.items()}
+
+
+def _compile_statuses(statuses):
+    """Map Jira status names to local statuses."""
+    by_name = {}
+    for key, names in statuses.items():
+        for name in [names] if isinstance(names, str) else names:
+            by_name.setdefault(name, key)
+    return by_name
+
+
+def _compile_actions(actions, types):
+    """Merge default actions with overrides of every issue type into read-only tables."""
+    default = actions.get('default', {})
+    compiled = {}
+    for type in list(actions) + [type for type in types if type not in actions]:
+        overrides = actions.get(type, {})
+        compiled[type] = MappingProxyType({
+            name: MappingProxyType(dict(default.get(name, {}), **overrides.get(name, {})))
+            for name in list(default) + [name for name in overrides if name not in default]
+        })
+    return MappingProxyType(compiled)
+
+
+TYPES_BY_NAME = _compile_types(ISSUE_TYPES)
+STATUSES_BY_NAME = _compile_statuses(STATUSES)
+ISSUE_ACTIONS = _compile_actions(ACTIONS, ISSUE_TYPES)
@@ -0,0 +1,153 @@
+"""Background process serving commands over Unix socket."""
+import io
+import json
+import os
+import signal
+import socket
+import sys
+import threading
+import traceback
+
+import click
+
+# Commands which do not read terminal input. Commands running git which may
+# need client's terminal, environment or credentials (commit, publish) are
+# not served.
+SERVED_COMMANDS = {'sync', 'index', 'flush', 'doctor'}
+OPTIONS_WITH_VALUE = {'--trace-output'}
+
+
+def command_name(argv):
+    """Return name of command given after group options."""
+    skip = False
+    for arg in argv:
+        if skip:
+            skip = False
+        elif arg in OPTIONS_WITH_VALUE:
+            skip = True
+        elif not arg.startswith('-'):
+            return arg
+    return None
+
+
+def is_served(argv):
+    """Check if command can run in daemon."""
+    if '--help' in argv:
+        return False
+    command = command_name(argv)
+    if command == 'workon':
+        return '-k' in argv or '--key' in argv
+    return command in SERVED_COMMANDS
+
+
+def run_remote(socket_file, argv):
+    """Run command in daemon, return exit code or None when daemon is not running."""
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(socket_file)
+    except OSError:
+        client.close()
+        return None
+    with client:
+        client.sendall((json.dumps({'argv': argv, 'cwd': os.getcwd()}) + '\n').encode('utf-8'))
+        for line in client.makefile('r', encoding='utf-8'):
+            message = json.loads(line)
+            if 'exit' in message:
+                return message['exit']
+            for name, stream in [('stdout', sys.stdout), ('stderr', sys.stderr)]:
+                if name in message:
+                    stream.write(message[name])
+                    stream.flush()
+    sys.stderr.write('Daemon stopped before the command finished.\n')
+    return 1
+
+
+def serve(socket_file, run, greeting=''):
+    """
+    Serve commands until interrupted or terminated.
+
+    Commands are run one at a time by `run(argv)` in the client's working
+    directory, their output is sent back to the client. `greeting` is printed
+    once daemon listens.
+    """
+    if os.path.exists(socket_file):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(socket_file)
+            exit('Daemon is already running.')
+        except OSError:
+            # Left by daemon which was killed.
+            os.remove(socket_file)
+        finally:
+            probe.close()
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_file)
+    os.chmod(socket_file, 0o600)
+    server.listen(8)
+    # Remove socket on `kill` as well.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    click.echo(greeting)
+    try:
+        while True:
+            connection, _ = server.accept()
+            with connection:
+                _handle(connection, run)
+    finally:
+        server.close()
+        os.remove(socket_file)
+
+
+def _handle(connection, run):
+    try:
+        request = json.loads(connection.makefile('r', encoding='utf-8').readline())
+    except ValueError:
+        # Connection closed without request, e.g. by the check if daemon runs.
+        return
+    lock = threading.Lock()
+    stdout, stderr, cwd = sys.stdout, sys.stderr, os.getcwd()
+    sys.stdout = _SocketStream(connection, 'stdout', lock)
+    sys.stderr = _SocketStream(connection, 'stderr', lock)
+    code = 0
+    try:
+        os.chdir(request['cwd'])
+        run(request['argv'])
+    except SystemExit as e:
+        if isinstance(e.code, str):
+            sys.stderr.write(e.code + '\n')
+            code = 1
+        else:
+            code = e.code or 0
+    except Exception:
+        traceback.print_exc()
+        code = 1
+    finally:
+        sys.stdout, sys.stderr = stdout, stderr
+        os.chdir(cwd)
+    _send(connection, lock, {'exit': code})
+
+
+def _send(connection, lock, message):
+    try:
+        with lock:
+            connection.sendall((json.dumps(message) + '\n').encode('utf-8'))
+    except OSError:
+        # Client is gone, let the command finish anyway.
+        pass
+
+
+class _SocketStream(io.TextIOBase):
+    """Text stream forwarding writes to client."""
+    encoding = 'utf-8'
+
+    def __init__(self, connection, name, lock):
+        self.connection = connection
+        self.name = name
+        self.lock = lock
+
+    def write(self, text):
+        _send(self.connection, self.lock, {self.name: text})
+        return len(text)
+
+    def isatty(self):
+        return False
@@ -1,12 +1,16 @@
 """Git related functionality."""
+import os
 import re
-import webbrowser
+import subprocess
 from urllib.parse import quote_plus
 
 import click
-from subprocess import check_output
+from subprocess import PIPE, STDOUT, CalledProcessError
+
+from jira_git_flow.tracing import tracer
 
 REMOTE_URL_REGEXP = '(https://|git@)([^:/]*)(:|/)([^\\.]*)(git)?'
+MISSING_REFSPEC_REGEXP = 'error: src refspec (.*) does not match any'
 
 GIT_PROVIDERS = {
     'bitbucket.org': {
@@ -18,13 +22,78 @@ GIT_PROVIDERS = {
 }
 
 
+class RepoContext(object):
+    """
+    Branches, HEAD and remotes of repository.
+
+    All refs are read by a single `git for-each-ref` call and remote urls by a
+    single `git config` call.
+    """
+    def __init__(self):
+        self.head = None
+        self.local_branches = set()
+        self.remote_branches = {}
+        refs = check_output(['git', 'for-each-ref', '--format=%(HEAD)%(refname)',
+                             'refs/heads', 'refs/remotes']).decode('utf-8')
+        for line in refs.splitlines():
+            current, ref = line[0] == '*', line[1:]
+            if ref.startswith('refs/heads/'):
+                branch = ref[len('refs/heads/'):]
+                self.local_branches.add(branch)
+                if current:
+                    self.head = branch
+            elif ref.startswith('refs/remotes/'):
+                remote, _, branch = ref[len('refs/remotes/'):].partition('/')
+                if branch != 'HEAD':
+                    self.remote_branches.setdefault(remote, set()).add(branch)
+        self.remotes = _get_remote_urls()
+
+    def branch_exists(self, branch):
+        """Check if branch exists either local or on any remote."""
+        return branch in self.local_branches or any(
+            branch in branches for branches in self.remote_branches.values())
+
+
+_contexts = {}
+
+
+def get_context():
+    """
+    Return context of repository in current directory.
+
+    Context is cached until refs, HEAD or fetched data of repository change.
+    """
+    git_dir = _find_git_dir(os.getcwd())
+    if git_dir is None:
+        return RepoContext()
+    stamp = _refs_stamp(git_dir)
+    cached = _contexts.get(git_dir)
+    if cached is None or cached[0] != stamp:
+        tracer.count('git context misses')
+        cached = _contexts[git_dir] = (stamp, RepoContext())
+    else:
+        tracer.count('git context hits')
+    return cached[1]
+
+
+def invalidate_context():
+    """Forget cached context of repository in current directory."""
+    _contexts.pop(_find_git_dir(os.getcwd()), None)
+
+
 def checkout(branch):
     """Checkout branch"""
     click.echo('Checkout on branch {}...'.format(branch))
-    if branch_exists(branch):
-        check_output(['git', 'checkout', branch])
+    context = get_context()
+    if context.head == branch:
         return
-    check_output(['git', 'checkout', '-b', branch])
+    try:
+        if context.branch_exists(branch):
+            check_output(['git', 'checkout', branch])
+            return
+        check_output(['git', 'checkout', '-b', branch])
+    finally:
+        invalidate_context()
 
 
 def commit(message):
@@ -32,22 +101,45 @@ def commit(message):
     check_output(['git', 'commit', '-a', '-m', '{}'.format(message)])
 
 
-def push(branch, remote='origin'):
-    """Push branch."""
-    check_output(['git', 'push', '-u', remote, branch])
+def push(*branches, remote='origin'):
+    """
+    Push branches with a single git push.
+
+    Return dict of branches which were not pushed with git error messages.
+    """
+    try:
+        result = _run(['git', 'push', '--porcelain', '-u', remote] + list(branches),
+                     stdout=PIPE, stderr=STDOUT)
+    finally:
+        invalidate_context()
+    lines = result.stdout.decode('utf-8', 'replace').splitlines()
+    errors = {}
+    for line in lines:
+        parts = line.split('\t')
+        if len(parts) == 3 and parts[0] == '!':
+            errors[parts[1].split(':')[0].replace('refs/heads/', '', 1)] = parts[2]
+        match = re.match(MISSING_REFSPEC_REGEXP, line)
+        if match:
+            errors[match.group(1)] = line
+    if result.returncode and not errors:
+        # Push failed as a whole, e.g. remote is unreachable.
+        return {branch: '\n'.join(lines) for branch in branches}
+    if result.returncode and not any(line.startswith('To ') for line in lines):
+        # Missing local branches abort the whole push, push the rest again.
+        rest = [branch for branch in branches if branch not in errors]
+        if rest:
+            errors.update(push(*rest, remote=remote))
+    return errors
 
 
 def branch_exists(branch_name):
     """Check if branch exists eiither local or remote"""
-    branches = check_output(['git', 'branch', '-a']).decode('utf-8').split('\n')
-    return bool([branch for branch in branches if branch_name in branch])
+    return get_context().branch_exists(branch_name)
 
 
 def remote_data(remote='origin'):
     """Get remote provider and project."""
-    remote_url = check_output(
-        ['git', 'remote', 'get-url', remote]
-    ).strip().decode()
+    remote_url = get_context().remotes.get(remote, '')
 
     match = re.match(REMOTE_URL_REGEXP, remote_url)
     if match:
@@ -57,6 +149,7 @@ def remote_data(remote='origin'):
 
 def create_pull_request(branch):
     """Open pull request creation view in browser."""
+    import webbrowser
     provider, project = remote_data()
     try:
         url = 'https://{provider}/{pull_request_url}'.format(
@@ -68,4 +161,72 @@ def create_pull_request(branch):
         )
         webbrowser.open(url)
     except KeyError:
-        click.exit('Unable to create pull request')
+        click.echo('Unable to create pull request for {}'.format(branch), err=True)
+
+
+def _get_remote_urls():
+    try:
+        output = check_output(['git', 'config', '--get-regexp', r'^remote\..*\.url$'])
+        output = output.decode('utf-8')
+    except CalledProcessError:
+        # No remotes configured.
+        return {}
+    remotes = {}
+    for line in output.splitlines():
+        name, _, url = line.partition(' ')
+        remotes[name[len('remote.'):-len('.url')]] = url
+    return remotes
+
+
+def _find_git_dir(path):
+    while True:
+        git_dir = os.path.join(path, '.git')
+        if os.path.isdir(git_dir):
+            return git_dir
+        if os.path.isfile(git_dir):
+            # Worktrees and submodules point to the git directory.
+            with open(git_dir, 'r') as f:
+                content = f.read().strip()
+            if content.startswith('gitdir:'):
+                return os.path.normpath(os.path.join(path, content[len('gitdir:'):].strip()))
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+
+
+def _find_common_dir(git_dir):
+    """Return directory with refs shared by linked worktrees, git dir itself otherwise."""
+    try:
+        with open(os.path.join(git_dir, 'commondir'), 'r') as f:
+            return os.path.normpath(os.path.join(git_dir, f.read().strip()))
+    except OSError:
+        return git_dir
+
+
+def _refs_stamp(git_dir):
+    """Modification times of files and directories changed by ref updates."""
+    common_dir = _find_common_dir(git_dir)
+    # Worktree's git dir keeps its HEAD, the common dir keeps refs.
+    paths = [git_dir, common_dir, os.path.join(common_dir, 'packed-refs'),
+             os.path.join(common_dir, 'FETCH_HEAD'), os.path.join(common_dir, 'config')]
+    for top in ('refs/heads', 'refs/remotes'):
+        for directory, _, _ in os.walk(os.path.join(common_dir, top)):
+            paths.append(directory)
+    stamp = []
+    for path in paths:
+        try:
+            stamp.append(os.stat(path).st_mtime_ns)
+        except OSError:
+            stamp.append(None)
+    return tuple(stamp)
+
+
+def check_output(args, **kwargs):
+    with tracer.span('git', ' '.join(args[:2])):
+        return subprocess.check_output(args, **kwargs)
+
+
+def _run(args, **kwargs):
+    with tracer.span('git', ' '.join(args[:2])):
+        return subprocess.run(args, **kwargs)
@@ -0,0 +1,127 @@
+"""Local full-text index of Jira issues."""
+import bisect
+import json
+import os
+import re
+
+from jira_git_flow.models import JiraIssue
+from jira_git_flow.util import write_atomic
+
+TOKEN_REGEXP = re.compile('[a-z0-9]+')
+
+
+def tokenize(text):
+    return TOKEN_REGEXP.findall(text.lower())
+
+
+def _key_number(key):
+    try:
+        return int(key.rsplit('-', 1)[1])
+    except (IndexError, ValueError):
+        return 0
+
+
+def _mtime(file):
+    try:
+        return os.stat(file).st_mtime_ns
+    except OSError:
+        return None
+
+
+class IssueIndex(object):
+    """
+    Inverted index of issue keys and summaries stored in JSON file.
+
+    Every token of issue key and summary points to the keys of issues containing
+    it. Query tokens match index tokens by prefix and all of them must match.
+    """
+    def __init__(self, file):
+        self.file = file
+        self._issues = None
+        self._tokens = None
+        self._sorted_tokens = None
+        self._dirty = False
+        self._mtime = None
+
+    def __len__(self):
+        return len(self._get_issues())
+
+    def add(self, issues):
+        """Add or refresh issues in the index."""
+        entries = self._get_issues()
+        for issue in issues:
+            entry = [issue.summary, issue.type, issue.status]
+            if entries.get(issue.key) == entry:
+                continue
+            if issue.key in entries:
+                self._remove_tokens(issue.key, entries[issue.key][0])
+            entries[issue.key] = entry
+            for token in set(tokenize(issue.key) + tokenize(issue.summary)):
+                self._tokens.setdefault(token, []).append(issue.key)
+            self._sorted_tokens = None
+            self._dirty = True
+
+    def search(self, keyword, type=None, limit=None):
+        """
+        Search issues matching keyword.
+
+        Exact key match goes first, other issues are ordered from the most
+        recently created one.
+        """
+        entries = self._get_issues()
+        matches = None
+        for query_token in tokenize(keyword):
+            keys = set()
+            for token in self._prefixed(query_token):
+                keys.update(self._tokens[token])
+            matches = keys if matches is None else matches & keys
+            if not matches:
+                return []
+        if matches is None:
+            return []
+
+        exact_key = keyword.strip().upper()
+        ranked = sorted(matches, key=lambda key: (key != exact_key, -_key_number(key)))
+        issues = [JiraIssue(key, *entries[key]) for key in ranked
+                  if type is None or entries[key][1] == type]
+        return issues[:limit] if limit else issues
+
+    def save(self):
+        if not self._dirty:
+            return
+        write_atomic(self.file, json.dumps({'issues': self._issues, 'tokens': self._tokens}))
+        self._dirty = False
+        self._mtime = _mtime(self.file)
+
+    def reload_if_changed(self):
+        """Drop loaded index when file was changed by other process."""
+        if self._issues is not None and not self._dirty and _mtime(self.file) != self._mtime:
+            self._issues = self._tokens = self._sorted_tokens = None
+
+    def _prefixed(self, prefix):
+        if self._sorted_tokens is None:
+            self._sorted_tokens = sorted(self._tokens)
+        tokens = self._sorted_tokens
+        for i in range(bisect.bisect_left(tokens, prefix), len(tokens)):
+            if not tokens[i].startswith(prefix):
+                break
+            yield tokens[i]
+
+    def _remove_tokens(self, key, summary):
+        for token in set(tokenize(key) + tokenize(summary)):
+            keys = self._tokens.get(token, [])
+            if key in keys:
+                keys.remove(key)
+            if not keys:
+                self._tokens.pop(token, None)
+
+    def _get_issues(self):
+        if self._issues is None:
+            self._mtime = _mtime(self.file)
+            try:
+                with open(self.file, 'r') as f:
+                    data = json.load(f)
+                self._issues, self._tokens = data['issues'], data['tokens']
+            except (OSError, ValueError, KeyError):
+                self._issues, self._tokens = {}, {}
+        return self._issues
@@ -1,49 +1,155 @@
+import re
+import threading
+
 import click
 from jira import JIRA, JIRAError
+from requests.adapters import HTTPAdapter
+
+from jira_git_flow.tracing import traced, tracer
+
+KEY_REGEXP = re.compile(r'^[A-Za-z][A-Za-z0-9_]*-[0-9]+$')
+# Characters with special meaning in Jira text search (~ operator)
+TEXT_SEARCH_SPECIAL = re.compile(r'([+\-&|!(){}\[\]^~*?:\\/])')
+# Fields required to build JiraIssue model
+FIELDS = ['summary', 'status', 'issuetype', 'subtasks']
+
+
+class Client(JIRA):
+    """JIRA client with keep-alive connection pool shared by concurrent callers."""
+
+    def __init__(self, url, basic_auth, pool_size, on_response, **kwargs):
+        self.pool_size = pool_size
+        self.on_response = on_response
+        super(Client, self).__init__(url, basic_auth=basic_auth, **kwargs)
+
+    def _create_http_basic_session(self, username, password, timeout=None):
+        super(Client, self)._create_http_basic_session(username, password, timeout=timeout)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
+        self._session.hooks['response'].append(self.on_response)
 
 
 class Jira(object):
     """JIRA objects and operations."""
 
-    def __init__(self, url, username, token, project, max_results):
-        self.jira = JIRA(url, basic_auth=(username, token))
+    def __init__(self, url, username, token, project, max_results, pool_size=10,
+                 get_server_info=False, transitions_cache=None, extra_fields=()):
+        self.url = url
+        self.username = username
+        self.token = token
         self.project = project
         self.max_results = max_results
+        self.pool_size = pool_size
+        self.get_server_info = get_server_info
+        self.transitions_cache = transitions_cache
+        self.fields = FIELDS + [field for field in extra_fields if field not in FIELDS]
+        self.requests_count = 0
+        self.bytes_count = 0
+        self._requests_lock = threading.Lock()
+        self._jira = None
+        self._jira_lock = threading.Lock()
 
-    def search_issues(self, keyword, **kwargs):
+    @property
+    def jira(self):
+        """JIRA client, created on first use."""
+        if self._jira is None:
+            with self._jira_lock:
+                if self._jira is None:
+                    with tracer.span('jira', 'connect'):
+                        self._jira = Client(self.url, (self.username, self.token),
+                                            self.pool_size, self._count_request,
+                                            get_server_info=self.get_server_info)
+        return self._jira
+
+    def _count_request(self, response, *args, **kwargs):
+        with self._requests_lock:
+            self.requests_count += 1
+            self.bytes_count += len(response.content)
+        tracer.count('jira requests')
+        tracer.count('jira bytes', len(response.content))
+
+    def search_issues(self, keyword, type=None):
+        """
+        Search Jira issues, the newest first.
+
+        Keyword is matched on Jira side in the project: against the summary
+        with text search or, when keyword looks like an issue key, against
+        the key as well.
+        Issues are yielded page by page, so next page is requested only when
+        the caller consumes the previous one.
         """
-        Search Jira issues.
+        keyword = keyword.strip()
+        conditions = ['summary ~ "{}"'.format(_escape_text(keyword))]
+        if KEY_REGEXP.match(keyword):
+            conditions.append('key = "{}"'.format(keyword.upper()))
+        query = 'project = "{}" AND ({})'.format(_escape(self.project), ' OR '.join(conditions))
+        if type:
+            query += ' AND type = "{}"'.format(_escape(type))
+
+        return self._search_all(query + ' order by created desc')
 
-        Filtering by keyword is not done on JIRA query becasue it does not support
-        filtering both summary and key by string values.
+    @traced('jira')
+    def get_issues_by_keys(self, keys):
         """
-        keyword = keyword.lower()
-        query_parameters = []
-        if kwargs.get('type'):
-            query_parameters.append('type = "{}"'.format(kwargs.get('type')))
+        Get issues by keys.
 
-        query = ' OR'.join(query_parameters) + ' order by created desc'
-        issues = self.jira.search_issues(query, maxResults=self.max_results)
+        Keys are queried in chunks with `key in (...)` JQL, so the number of
+        requests depends on the number of pages, not on the number of keys.
+        Issues are returned in order of given keys, missing issues are skipped.
+        """
+        issues = {}
+        for i in range(0, len(keys), self.max_results):
+            query = 'key in ({})'.format(', '.join(keys[i:i + self.max_results]))
+            for issue in self._search_all(query):
+                issues[issue.key] = issue
 
-        matching_issues = []
-        for issue in issues:
-            if keyword in issue.key.lower() or keyword in issue.fields.summary.lower():
-                matching_issues.append(issue)
+        return [issues.pop(key) for key in keys if key in issues] + list(issues.values())
 
-        return matching_issues
+    @traced('jira')
+    def get_updated_issues(self, keys, minutes):
+        """Get issues with given keys and their subtasks updated in last minutes."""
+        issues = []
+        for i in range(0, len(keys), self.max_results):
+            chunk = ', '.join(keys[i:i + self.max_results])
+            query = '(key in ({0}) OR parent in ({0})) AND updated >= -{1}m'.format(chunk, minutes)
+            issues.extend(self._search_all(query, fields=self.fields + ['parent']))
+        return issues
 
+    def get_project_issues(self):
+        """Get all project issues, the newest first."""
+        return self._search_all('project = "{}" order by created desc'.format(self.project))
+
+    @traced('jira', 'search')
+    def _search_all(self, query, fields=None):
+        """Get all issues matching query, page by page."""
+        start_at = 0
+        while True:
+            with tracer.span('jira', 'search page'):
+                page = self.jira.search_issues(query, startAt=start_at, maxResults=self.max_results,
+                                               validate_query=False, fields=fields or self.fields)
+            for issue in page:
+                yield issue
+            start_at += len(page)
+            if not page or page.total is None or start_at >= page.total:
+                return
+
+    @traced('jira')
     def get_issue_by_key(self, key):
         """Get issue by key"""
         try:
-            return self.jira.issue(key)
+            return self.jira.issue(key, fields=','.join(self.fields))
         except JIRAError as e:
             if e.status_code == 404:
                 raise click.UsageError('The specified JIRA issue: {}, does not exist.'.format(key))
             raise
 
+    @traced('jira')
     def create_issue(self, fields):
-        return self.jira.create_issue(fields=fields)
+        issue = self.jira.create_issue(fields=fields, prefetch=False)
+        return self.get_issue_by_key(issue.key)
 
+    @traced('jira')
     def get_resolution_by_name(self, name):
         resolutions = self.jira.resolutions()
         for r in resolutions:
@@ -51,13 +157,49 @@ class Jira(object):
                 return r.id
         return None
 
+    @traced('jira')
     def get_transition(self, issue, name):
         return self.jira.find_transitionid_by_name(issue, name)
 
-    def transition_issue(self, issue, transition):
+    @traced('jira')
+    def transition_issue(self, issue, transition, state=None):
+        """
+        Transition issue by transition name.
+
+        When issue workflow state (issue type and status) is given, transition id
+        is taken from cache. It is looked up in Jira on a cache miss or when
+        cached id is rejected.
+        """
+        if state is None or self.transitions_cache is None:
+            transition_id = self.get_transition(issue, transition)
+            if transition_id:
+                self.jira.transition_issue(issue, transition_id)
+            return
+
+        cache_key = ':'.join((self.project,) + tuple(state) + (transition,))
+        transition_id = self.transitions_cache.get(cache_key)
+        if transition_id:
+            try:
+                self.jira.transition_issue(issue, transition_id)
+                return
+            except JIRAError:
+                self.transitions_cache.invalidate(cache_key)
+
         transition_id = self.get_transition(issue, transition)
         if transition_id:
             self.jira.transition_issue(issue, transition_id)
+            self.transitions_cache.set(cache_key, transition_id)
 
+    @traced('jira')
     def assign_issue(self, issue, assignee):
         self.jira.assign_issue(issue, assignee)
+
+
+def _escape(value):
+    """Escape value for JQL string literal."""
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def _escape_text(value):
+    """Escape value for text search in JQL string literal."""
+    return _escape(TEXT_SEARCH_SPECIAL.sub(r'\\\1', value))
@@ -3,19 +3,27 @@ from jira_git_flow import config
 
 
 class JiraIssue(object):
-    """Jira simplified issue"""
-    def __init__(self, key, summary, type, status, subtasks=[]):
+    """
+    Jira simplified issue.
+
+    Issues are equal when their keys are equal, so they can be used in sets
+    and as dict keys.
+    """
+    __slots__ = ('key', 'summary', 'type', 'status', 'subtasks')
+
+    def __init__(self, key, summary, type, status, subtasks=None):
         self.key = key
         self.summary = summary
         self.type = type
         self.status = status
-        self.subtasks = subtasks
-        self.full_name = self.__repr__()
+        self.subtasks = subtasks if subtasks is not None else []
 
     def __hash__(self):
-        return self.key.split('-')[1]
+        return hash(self.key)
 
     def __eq__(self, obj):
+        if not isinstance(obj, JiraIssue):
+            return NotImplemented
         return self.key == obj.key
 
     def __repr__(self):
@@ -41,16 +49,8 @@ def _get_subtasks(jira_issue):
 
 
 def _get_type(jira_issue):
-    jira_type = jira_issue.fields.issuetype.name
-    for key, value in config.ISSUE_TYPES.items():
-        if jira_type == value['name']:
-            return key
-    return None
+    return config.TYPES_BY_NAME.get(jira_issue.fields.issuetype.name)
 
 
 def _get_status(jira_issue):
-    jira_status = jira_issue.fields.status.name
-    for key, value in config.STATUSES.items():
-        if jira_status in value:
-            return key
-    return None
+    return config.STATUSES_BY_NAME.get(jira_issue.fields.status.name)
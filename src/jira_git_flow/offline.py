@@ -0,0 +1,64 @@
+"""Durable queue of Jira actions performed later."""
+import json
+import os
+import time
+
+from jira_git_flow import config
+from jira_git_flow.util import write_atomic
+
+
+class ActionQueue(object):
+    """
+    Jira actions stored in JSON lines file.
+
+    Every entry keeps issue, action name, its transitions, expected current
+    and next state and assignee, so it can be replayed without configuration
+    of the moment it was queued. When `enabled`, actions are queued instead of
+    being performed. `replayed` marks that the command already replayed queue.
+    """
+    def __init__(self, file):
+        self.file = file
+        self.enabled = False
+        self.replayed = False
+
+    def append(self, issue, action_name, action, assignee):
+        entry = {
+            'key': issue.key, 'summary': issue.summary, 'type': issue.type,
+            'action': action_name, 'transitions': list(action['transitions']),
+            'current_state': action['current_state'], 'next_state': action['next_state'],
+            'assignee': assignee, 'queued_at': time.time(),
+        }
+        with open(self.file, 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def load(self):
+        """Return queued entries, the oldest first."""
+        if not os.path.exists(self.file):
+            return []
+        entries = []
+        with open(self.file, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    # Line cut by interrupted write.
+                    continue
+        return entries
+
+    def replace(self, entries):
+        """Keep only given entries in queue."""
+        if entries:
+            write_atomic(self.file, ''.join(json.dumps(entry) + '\n' for entry in entries))
+        elif os.path.exists(self.file):
+            os.remove(self.file)
+
+    def __bool__(self):
+        return os.path.exists(self.file) and os.path.getsize(self.file) > 0
+
+
+action_queue = ActionQueue(config.QUEUE_FILE)
@@ -0,0 +1,167 @@
+"""Pipeline of concurrent processing stages."""
+import queue
+import sys
+import threading
+
+import click
+
+_END = object()
+
+
+class Stage(object):
+    """
+    Single processing step.
+
+    `function` is called with an item and fails by raising an exception
+    (`SystemExit` as well).
+    Batch stage `function` is called with a list of all items waiting for the
+    stage and returns dict of failed items and their errors.
+    """
+    def __init__(self, name, function, workers=1, batch=False):
+        self.name = name
+        self.function = function
+        self.workers = max(workers, 1)
+        self.batch = batch
+
+
+class Pipeline(object):
+    """
+    Items pass through stages in order.
+
+    Every stage has its own worker threads, so different items are processed
+    by different stages at the same time. Item failing in a stage is dropped
+    from the following stages. Progress of stages is shown on terminal.
+    """
+    def __init__(self, stages, progress=None):
+        self.stages = stages
+        self.progress = sys.stderr.isatty() if progress is None else progress
+        self._queues = [queue.Queue() for _ in stages]
+        self._running = [stage.workers for stage in stages]
+        self._processed = [0 for _ in stages]
+        self._dropped = [0 for _ in stages]
+        # Error which stopped all workers of stage.
+        self._stopped = [None for _ in stages]
+        self._done = []
+        self._failed = []
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def run(self, items):
+        """
+        Process items, return items which passed all stages and list of
+        (item, stage name, error) of failed ones, both in order of `items`.
+        """
+        items = list(items)
+        self._total = len(items)
+        if not self.stages or not items:
+            return items, []
+        for item in items:
+            self._queues[0].put(item)
+        self._close(0)
+        threads = [threading.Thread(target=self._work, args=(i,), daemon=True)
+                   for i, stage in enumerate(self.stages) for _ in range(stage.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if self.progress:
+            click.echo(err=True)
+
+        order = {id(item): i for i, item in enumerate(items)}
+        done = sorted(self._done, key=lambda item: order[id(item)])
+        failed = sorted(self._failed, key=lambda failure: order[id(failure[0])])
+        return done, failed
+
+    def _work(self, index):
+        error = None
+        try:
+            self._consume(index)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            # Even dying worker has to let the following stage finish.
+            with self._lock:
+                self._running[index] -= 1
+                last = not self._running[index]
+                if last and error is not None:
+                    self._stopped[index] = error
+                    self._fail_waiting(index, error)
+            if last:
+                self._close(index + 1)
+
+    def _consume(self, index):
+        stage = self.stages[index]
+        while True:
+            item = self._queues[index].get()
+            if item is _END:
+                break
+            if not stage.batch:
+                self._process(index, [item])
+                continue
+            batch, end = [item], False
+            while True:
+                try:
+                    item = self._queues[index].get_nowait()
+                except queue.Empty:
+                    break
+                if item is _END:
+                    end = True
+                    break
+                batch.append(item)
+            self._process(index, batch)
+            if end:
+                break
+
+    def _process(self, index, items):
+        stage = self.stages[index]
+        try:
+            if stage.batch:
+                errors = stage.function(items)
+            else:
+                stage.function(items[0])
+                errors = {}
+        except BaseException as e:
+            # Including exit() called by stage.
+            errors = {item: e for item in items}
+        with self._lock:
+            self._processed[index] += len(items)
+            for item in items:
+                if item in errors:
+                    self._fail(index, item, errors[item])
+                elif index + 1 == len(self.stages):
+                    self._done.append(item)
+                elif self._stopped[index + 1] is not None:
+                    self._fail(index + 1, item, self._stopped[index + 1])
+                else:
+                    self._queues[index + 1].put(item)
+            self._show_progress()
+
+    def _fail_waiting(self, index, error):
+        """Fail items left in queue of stage without workers."""
+        while True:
+            try:
+                item = self._queues[index].get_nowait()
+            except queue.Empty:
+                return
+            if item is not _END:
+                self._fail(index, item, error)
+
+    def _fail(self, index, item, error):
+        self._failed.append((item, self.stages[index].name, error))
+        self._dropped[index] += 1
+
+    def _close(self, index):
+        if index < len(self.stages):
+            for _ in range(self.stages[index].workers):
+                self._queues[index].put(_END)
+
+    def _show_progress(self):
+        if not self.progress:
+            return
+        parts, total = [], self._total
+        for stage, processed, dropped in zip(self.stages, self._processed, self._dropped):
+            parts.append('{} {}/{}'.format(stage.name, processed, total))
+            total -= dropped
+        line = '  '.join(parts)
+        click.echo('\r' + line, nl=False, err=True)
@@ -0,0 +1,26 @@
+"""Marshmallow schemas of local data, used to validate storage."""
+from marshmallow import Schema, fields, post_load
+
+from jira_git_flow.models import JiraIssue
+
+
+class IssueSchema(Schema):
+    key = fields.Str()
+    summary = fields.Str()
+    status = fields.Str()
+    type = fields.Str()
+
+    @post_load
+    def make_issue(self, data):
+        return JiraIssue(**data)
+
+
+class StorySchema(IssueSchema):
+    subtasks = fields.Nested(IssueSchema, many=True)
+
+
+class StorageSchema(Schema):
+    current_story = fields.Nested(StorySchema, allow_none=True, exclude=["subtasks"])
+    current_issue = fields.Nested(IssueSchema, allow_none=True)
+    stories = fields.Nested(StorySchema, many=True, allow_none=True)
+    last_sync = fields.Float(allow_none=True)
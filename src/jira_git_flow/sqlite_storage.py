@@ -0,0 +1,309 @@
+"""Storage based on SQLite database."""
+import json
+import os
+import sqlite3
+from contextlib import contextmanager
+
+import click
+
+from jira_git_flow.models import JiraIssue
+from jira_git_flow.tracing import tracer
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS stories (
+    key TEXT PRIMARY KEY,
+    summary TEXT,
+    type TEXT,
+    status TEXT
+);
+CREATE TABLE IF NOT EXISTS subtasks (
+    key TEXT PRIMARY KEY,
+    story_key TEXT NOT NULL,
+    summary TEXT,
+    type TEXT,
+    status TEXT
+);
+CREATE TABLE IF NOT EXISTS state (
+    name TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE INDEX IF NOT EXISTS stories_status ON stories (status);
+CREATE INDEX IF NOT EXISTS stories_type ON stories (type);
+CREATE INDEX IF NOT EXISTS subtasks_story_key ON subtasks (story_key);
+CREATE INDEX IF NOT EXISTS subtasks_status ON subtasks (status);
+CREATE INDEX IF NOT EXISTS subtasks_type ON subtasks (type);
+'''
+
+CURRENT_STORY = 'current_story'
+CURRENT_ISSUE = 'current_issue'
+STORIES = 'stories'
+LAST_SYNC = 'last_sync'
+
+
+class SqliteStorage(object):
+    """
+    Storage based on SQLite database.
+
+    Provides the same interface as JSON `Storage`. Stories and subtasks are
+    kept in tables indexed by key, status and type. Order of stories and
+    subtasks is the order they were added in.
+
+    When database does not exist yet, data is migrated from `json_file`.
+    With `validate` set, data is checked with marshmallow schema of JSON
+    storage when database is opened.
+    """
+    def __init__(self, file, json_file=None, validate=False):
+        self.file = file
+        self.json_file = json_file
+        self.validate = validate
+        self._db = None
+        self._transactions = 0
+        self._in_transaction = False
+
+    @property
+    def db(self):
+        if self._db is None:
+            with tracer.span('storage', 'load'):
+                migrate = not os.path.exists(self.file)
+                self._db = sqlite3.connect(self.file, isolation_level=None)
+                self._db.executescript(SCHEMA)
+                if migrate and self.json_file and os.path.exists(self.json_file):
+                    self._migrate()
+                if self.validate:
+                    self._validate()
+        return self._db
+
+    @contextmanager
+    def transaction(self):
+        """Commit changes made in the block once, at its end."""
+        self.begin()
+        try:
+            yield self
+        finally:
+            self.commit()
+
+    def begin(self):
+        self._transactions += 1
+
+    def commit(self):
+        self._transactions -= 1
+        if not self._transactions and self._in_transaction:
+            with tracer.span('storage', 'save'):
+                self.db.execute('COMMIT')
+            self._in_transaction = False
+
+    def reload_if_changed(self):
+        """Queries read current data, nothing to reload."""
+
+    def get_current_story(self):
+        """Return story currently work on."""
+        return self._get_state_issue(CURRENT_STORY)
+
+    def get_current_issue(self):
+        """Return issue currently work on."""
+        return self._get_state_issue(CURRENT_ISSUE)
+
+    def get_stories(self):
+        """Return stories currently work on."""
+        stories = [JiraIssue(*row) for row in self.db.execute(
+            'SELECT key, summary, type, status FROM stories ORDER BY rowid')]
+        by_key = {story.key: story for story in stories}
+        for row in self.db.execute(
+                'SELECT story_key, key, summary, type, status FROM subtasks ORDER BY rowid'):
+            if row[0] in by_key:
+                by_key[row[0]].subtasks.append(JiraIssue(*row[1:]))
+        return stories
+
+    def get_last_sync(self):
+        """Return time of the last sync with Jira."""
+        value = self._get_state(LAST_SYNC)
+        return float(value) if value is not None else None
+
+    def get(self, type):
+        return {
+            CURRENT_STORY: self.get_current_story,
+            CURRENT_ISSUE: self.get_current_issue,
+            STORIES: self.get_stories,
+            LAST_SYNC: self.get_last_sync,
+        }[type]()
+
+    def update_issue(self, issue):
+        if self._replace_issue(issue):
+            return issue
+
+    def update_issues(self, issues):
+        """Update many issues in a single transaction."""
+        with self.transaction():
+            return [issue for issue in issues if self._replace_issue(issue)]
+
+    def update_subtask(self, subtask):
+        if self._replace_subtask(subtask):
+            return subtask
+
+    def sync(self, stories, synced_at=None):
+        with self.transaction():
+            self._write('DELETE FROM subtasks')
+            self._write('DELETE FROM stories')
+            for story in stories:
+                self._insert_story(JiraIssue.from_issue(story))
+            self._set_state(LAST_SYNC, synced_at)
+
+    def merge(self, stories, subtasks, synced_at):
+        """
+        Merge changed issues into stored stories.
+
+        Subtasks are given as (parent key, subtask) pairs, new subtasks
+        are added to their stories.
+        """
+        with self.transaction():
+            for story in stories:
+                self._replace_issue(story)
+            for parent_key, subtask in subtasks:
+                if self._get_story_row(parent_key) and not self._replace_subtask(subtask):
+                    self._insert_subtask(parent_key, subtask)
+            self._set_state(LAST_SYNC, synced_at)
+
+    def resolve_issue(self, issue):
+        self._set_state_issue(CURRENT_ISSUE, None)
+
+    def add_issue(self, issue):
+        with self.transaction():
+            if issue.type == 'story':
+                if not self._get_story_row(issue.key):
+                    self._insert_story(issue)
+                self.work_on_story(issue)
+            else:
+                parent = self._get_parent(issue)
+                if not self._get_subtask_row(issue.key):
+                    self._insert_subtask(parent.key, issue)
+                self.work_on_issue(issue)
+
+    def work_on_story(self, story):
+        """Keep state of current story."""
+        with self.transaction():
+            self._set_state_issue(CURRENT_STORY, story)
+            self._set_state_issue(CURRENT_ISSUE, None)
+
+    def work_on_issue(self, issue):
+        """Keep state of current issue."""
+        parent = self._get_parent(issue)
+        with self.transaction():
+            self._set_state_issue(CURRENT_STORY, parent)
+            self._set_state_issue(CURRENT_ISSUE, issue)
+
+    def finish(self, story):
+        with self.transaction():
+            if self.get_current_story() == story:
+                self._set_state_issue(CURRENT_STORY, None)
+            if not self._write('DELETE FROM stories WHERE key = ?', (story.key,)):
+                raise ValueError('{} is not in stories'.format(story))
+            self._write('DELETE FROM subtasks WHERE story_key = ?', (story.key,))
+
+    def _migrate(self):
+        from jira_git_flow.storage import Storage
+        json_storage = Storage(self.json_file)
+        with self.transaction():
+            self.sync(json_storage.get_stories(), json_storage.get_last_sync())
+            self._set_state_issue(CURRENT_STORY, json_storage.get_current_story())
+            self._set_state_issue(CURRENT_ISSUE, json_storage.get_current_issue())
+        click.echo('Migrated {} stories from {}.'.format(
+            len(json_storage.get_stories()), self.json_file))
+
+    def _validate(self):
+        from jira_git_flow.schemas import StorageSchema
+        stories, orphans = {}, []
+        for key, summary, type, status in self.db.execute(
+                'SELECT key, summary, type, status FROM stories ORDER BY rowid'):
+            stories[key] = {'key': key, 'summary': summary, 'type': type, 'status': status,
+                            'subtasks': []}
+        for story_key, key, summary, type, status in self.db.execute(
+                'SELECT story_key, key, summary, type, status FROM subtasks ORDER BY rowid'):
+            if story_key in stories:
+                stories[story_key]['subtasks'].append(
+                    {'key': key, 'summary': summary, 'type': type, 'status': status})
+            else:
+                orphans.append(key)
+        data = {'stories': list(stories.values())}
+        try:
+            for name in (CURRENT_STORY, CURRENT_ISSUE):
+                value = self._get_state(name)
+                data[name] = json.loads(value) if value else None
+            last_sync = self._get_state(LAST_SYNC)
+            data[LAST_SYNC] = float(last_sync) if last_sync is not None else None
+        except ValueError as e:
+            exit('Failed to load data: {}'.format(e))
+        errors = StorageSchema().load(data).errors
+        if orphans:
+            errors['subtasks'] = 'Stories of {} do not exist.'.format(', '.join(orphans))
+        if errors:
+            exit('Failed to load data: {}'.format(errors))
+
+    def _replace_issue(self, issue):
+        if not self._get_story_row(issue.key):
+            return self._replace_subtask(issue)
+        with self.transaction():
+            self._write('UPDATE stories SET summary = ?, type = ?, status = ? WHERE key = ?',
+                        (issue.summary, issue.type, issue.status, issue.key))
+            self._write('DELETE FROM subtasks WHERE story_key = ?', (issue.key,))
+            for subtask in issue.subtasks:
+                self._insert_subtask(issue.key, subtask)
+        return True
+
+    def _replace_subtask(self, subtask):
+        return bool(self._write(
+            'UPDATE subtasks SET summary = ?, type = ?, status = ? WHERE key = ?',
+            (subtask.summary, subtask.type, subtask.status, subtask.key)))
+
+    def _insert_story(self, story):
+        self._write('INSERT INTO stories (key, summary, type, status) VALUES (?, ?, ?, ?)',
+                    (story.key, story.summary, story.type, story.status))
+        for subtask in story.subtasks:
+            self._insert_subtask(story.key, subtask)
+
+    def _insert_subtask(self, story_key, subtask):
+        self._write('INSERT OR REPLACE INTO subtasks (key, story_key, summary, type, status) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (subtask.key, story_key, subtask.summary, subtask.type, subtask.status))
+
+    def _get_parent(self, issue):
+        row = self._get_subtask_row(issue.key)
+        if row:
+            story = self._get_story_row(row[0])
+            if story:
+                return JiraIssue(*story)
+        return self.get_current_story()
+
+    def _get_story_row(self, key):
+        return self.db.execute('SELECT key, summary, type, status FROM stories WHERE key = ?',
+                               (key,)).fetchone()
+
+    def _get_subtask_row(self, key):
+        return self.db.execute('SELECT story_key FROM subtasks WHERE key = ?', (key,)).fetchone()
+
+    def _get_state(self, name):
+        row = self.db.execute('SELECT value FROM state WHERE name = ?', (name,)).fetchone()
+        return row[0] if row else None
+
+    def _set_state(self, name, value):
+        value = None if value is None else str(value)
+        if self._get_state(name) != value:
+            self._write('INSERT OR REPLACE INTO state (name, value) VALUES (?, ?)', (name, value))
+
+    def _get_state_issue(self, name):
+        value = self._get_state(name)
+        return JiraIssue(**json.loads(value)) if value else None
+
+    def _set_state_issue(self, name, issue):
+        value = None
+        if issue is not None:
+            value = json.dumps({'key': issue.key, 'summary': issue.summary,
+                                'type': issue.type, 'status': issue.status}, sort_keys=True)
+        self._set_state(name, value)
+
+    def _write(self, sql, parameters=()):
+        """Execute modifying statement, return number of changed rows."""
+        if self._transactions and not self._in_transaction:
+            self.db.execute('BEGIN')
+            self._in_transaction = True
+        return self.db.execute(sql, parameters).rowcount
+
@@ -0,0 +1,97 @@
+"""Persistent latency statistics of recent commands."""
+import json
+import math
+import time
+
+from jira_git_flow.util import write_atomic
+
+# Histogram buckets grow by sqrt(2), latency is stored in milliseconds.
+BUCKETS_PER_DOUBLING = 2
+MIN_MILLISECONDS = 0.01
+PERCENTILES = (50, 95, 99)
+
+
+def bucket(seconds):
+    milliseconds = max(seconds * 1000, MIN_MILLISECONDS)
+    return int(math.floor(math.log2(milliseconds) * BUCKETS_PER_DOUBLING))
+
+
+def bucket_milliseconds(index):
+    """Geometric middle of bucket."""
+    return 2 ** ((index + 0.5) / BUCKETS_PER_DOUBLING)
+
+
+def percentile(histogram, percent):
+    """Return approximate percentile in milliseconds of {bucket: count} histogram."""
+    total = sum(histogram.values())
+    if not total:
+        return None
+    threshold = total * percent / 100.0
+    seen = 0
+    for index in sorted(histogram):
+        seen += histogram[index]
+        if seen >= threshold:
+            return bucket_milliseconds(index)
+
+
+class Stats(object):
+    """
+    Latency histograms and counters of the last `runs` commands stored in JSON file.
+
+    Every run keeps histogram of every span name recorded by tracer (Jira
+    calls, git commands, storage I/O) and tracer counters.
+    """
+    def __init__(self, file, runs):
+        self.file = file
+        self.runs = runs
+
+    def record(self, command, tracer):
+        histograms = {}
+        for category, name, _, duration, _ in tracer.spans:
+            histogram = histograms.setdefault('{} {}'.format(category, name), {})
+            index = str(bucket(duration))
+            histogram[index] = histogram.get(index, 0) + 1
+        runs = self.load()
+        runs.append({'command': command, 'time': time.time(), 'seconds': tracer.elapsed,
+                     'histograms': histograms, 'counters': dict(tracer.counters)})
+        write_atomic(self.file, json.dumps({'runs': runs[-self.runs:]}))
+
+    def load(self):
+        try:
+            with open(self.file, 'r') as f:
+                return json.load(f)['runs']
+        except (OSError, ValueError, KeyError):
+            return []
+
+    def latencies(self, runs):
+        """Return (span name, calls, p50, p95, p99) rows, the slowest p95 first."""
+        merged = {}
+        for run in runs:
+            for name, histogram in run['histograms'].items():
+                total = merged.setdefault(name, {})
+                for index, count in histogram.items():
+                    total[int(index)] = total.get(int(index), 0) + count
+        rows = [(name, sum(histogram.values()))
+                + tuple(percentile(histogram, p) for p in PERCENTILES)
+                for name, histogram in merged.items()]
+        return sorted(rows, key=lambda row: -row[3])
+
+    def counters(self, runs):
+        totals = {}
+        for run in runs:
+            for name, value in run['counters'].items():
+                totals[name] = totals.get(name, 0) + value
+        return totals
+
+    def commands(self, runs):
+        """Return (command, runs, average Jira requests, average seconds) rows."""
+        by_command = {}
+        for run in runs:
+            by_command.setdefault(run['command'], []).append(run)
+        rows = []
+        for command, command_runs in by_command.items():
+            requests = sum(run['counters'].get('jira requests', 0) for run in command_runs)
+            seconds = sum(run['seconds'] for run in command_runs)
+            rows.append((command, len(command_runs), requests / len(command_runs),
+                         seconds / len(command_runs)))
+        return sorted(rows)
@@ -1,78 +1,116 @@
 import click
 import json
-from marshmallow import Schema, fields, post_load
+from contextlib import contextmanager
 import os
 
 from jira_git_flow import config
 from jira_git_flow.models import JiraIssue
+from jira_git_flow.tracing import traced
+from jira_git_flow.util import write_atomic
 
 
 class Keys(object):
     current_story = 'current_story'
     current_issue = 'current_issue'
     stories = 'stories'
+    last_sync = 'last_sync'
 
 
 INIT_DATA = {
     Keys.current_story: None,
     Keys.current_issue: None,
     Keys.stories: [],
+    Keys.last_sync: None,
 }
+ISSUE_FIELDS = ('key', 'summary', 'type', 'status')
 
 
-class IssueSchema(Schema):
-    key = fields.Str()
-    summary = fields.Str()
-    status = fields.Str()
-    type = fields.Str()
-
-    @post_load
-    def make_issue(self, data):
-        return JiraIssue(**data)
-
+class Storage(object):
+    """
+    Storage based on JSON file.
 
-class StorySchema(IssueSchema):
-    subtasks = fields.Nested(IssueSchema, many=True)
+    Changes are written when made outside of a transaction. Inside of
+    a transaction they are written once, when the outermost one ends.
+    Operations which do not change anything do not write at all.
 
+    Data is loaded on first access with a decoder written for the storage
+    format. With `validate` set it is loaded with marshmallow schema instead,
+    which reports invalid data.
 
-class StorageSchema(Schema):
-    current_story = fields.Nested(StorySchema, allow_none=True, exclude=["subtasks"])
-    current_issue = fields.Nested(IssueSchema, allow_none=True)
-    stories = fields.Nested(StorySchema, many=True, allow_none=True)
+    Positions of stories and subtasks are indexed by issue keys, so lookups
+    do not scan stored issues.
+    """
+    def __init__(self, file, validate=False):
+        self.file = file
+        self.validate = validate
+        self._data = None
+        self._stories_index = {}
+        self._subtasks_index = {}
+        self._transactions = 0
+        self._dirty = False
+        self._mtime = None
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._mtime = _mtime(self.file)
+            self._data = self._load_data()
+            self._build_index()
+        return self._data
+
+    def reload_if_changed(self):
+        """Drop loaded data when file was changed by other process."""
+        if self._data is not None and not self._transactions and _mtime(self.file) != self._mtime:
+            self._data = None
+
+    @contextmanager
+    def transaction(self):
+        """Write changes made in the block once, at its end."""
+        self.begin()
+        try:
+            yield self
+        finally:
+            self.commit()
 
+    def begin(self):
+        self._transactions += 1
 
-class Storage(object):
-    """Storage based on JSON file."""
-    def __init__(self, file, schema):
-        self.file = file
-        self.schema = schema
-        self._init_data()
-        self._load_data()
+    def commit(self):
+        self._transactions -= 1
+        if not self._transactions and self._dirty:
+            self._write_data()
 
+    @traced('storage', 'load')
     def _load_data(self):
+        if not os.path.exists(self.file):
+            return _decode(INIT_DATA)
         try:
             with open(self.file, 'r') as f:
                 file_data = json.load(f)
-                schema_data = self.schema.load(file_data)
-                if schema_data.errors:
-                    exit('Failed to load data: {}'.format(schema_data.errors))
-                self.data = self.schema.load(file_data).data
+            if not self.validate:
+                return _decode(file_data)
+            from jira_git_flow.schemas import StorageSchema
+            schema_data = StorageSchema().load(file_data)
+            if schema_data.errors:
+                exit('Failed to load data: {}'.format(schema_data.errors))
+            return dict(_decode(INIT_DATA), **schema_data.data)
         except Exception:
             click.echo('Failed to load data. Starting with empty one.')
-            self.data = INIT_DATA
+            return _decode(INIT_DATA)
 
     def _save_data(self):
-        with open(self.file, 'w') as f:
-            try:
-                json_data = self.schema.dump(self.data).data
-                json.dump(json_data, f, indent=4)
-            except Exception as e:
-                exit('Failed to save data: {}'.format(e))
-
-    def _init_data(self):
-        if not os.path.exists(self.file):
-            with open(self.file, 'w+') as f:
-                json.dump(INIT_DATA, f, indent=4)
+        self._dirty = True
+        if not self._transactions:
+            self._write_data()
+
+    @traced('storage', 'save')
+    def _write_data(self):
+        try:
+            write_atomic(self.file, json.dumps(_encode(self.data)))
+        except Exception as e:
+            exit('Failed to save data: {}'.format(e))
+        self._dirty = False
+        self._mtime = _mtime(self.file)
 
     def get_current_story(self):
         """Return story currently work on."""
@@ -86,89 +124,218 @@ class Storage(object):
         """Return stories currently work on."""
         return self._get_value(Keys.stories)
 
+    def get_last_sync(self):
+        """Return time of the last sync with Jira."""
+        return self._get_value(Keys.last_sync)
+
     def get(self, type):
         return self._get_value(type)
 
     def update_issue(self, issue):
-        stories = self.get_stories()
-        try:
-            story_index = stories.index(issue)
-            stories[story_index] = issue
+        if self._replace_issue(issue):
             self._save_data()
             return issue
-        except ValueError:
-            pass
 
-        return self.update_subtask(issue)
+    def update_issues(self, issues):
+        """Update many issues with a single save."""
+        updated = [issue for issue in issues if self._replace_issue(issue)]
+        if updated:
+            self._save_data()
+        return updated
 
     def update_subtask(self, subtask):
+        if self._replace_subtask(subtask):
+            self._save_data()
+            return subtask
+
+    def _replace_issue(self, issue):
         stories = self.get_stories()
-        for story in stories:
-            try:
-                subtask_index = story.subtasks.index(subtask)
-                story.subtasks[subtask_index] = subtask
-                self._save_data()
-                return subtask
-            except ValueError:
-                pass
-
-    def sync(self, stories):
+        position = self._stories_index.get(issue.key)
+        if position is None:
+            return self._replace_subtask(issue)
+        self._unindex_subtasks(stories[position])
+        stories[position] = issue
+        self._index_subtasks(issue)
+        return True
+
+    def _replace_subtask(self, subtask):
+        location = self._get_subtask_location(subtask.key)
+        if location is None:
+            return False
+        story_key, position = location
+        self._get_story(story_key).subtasks[position] = subtask
+        return True
+
+    def sync(self, stories, synced_at=None):
         synced_stories = [JiraIssue.from_issue(story) for story in stories]
         self.data[Keys.stories] = synced_stories
+        self.data[Keys.last_sync] = synced_at
+        self._build_index()
         self._save_data()
 
-    def resolve_issue(self, issue):
-        self.data[Keys.current_issue] = None
+    def merge(self, stories, subtasks, synced_at):
+        """
+        Merge changed issues into stored stories.
+
+        Subtasks are given as (parent key, subtask) pairs, new subtasks
+        are added to their stories.
+        """
+        for story in stories:
+            self._replace_issue(story)
+        for parent_key, subtask in subtasks:
+            parent = self._get_story(parent_key)
+            if parent and not self._replace_subtask(subtask):
+                self._add_subtask(parent, subtask)
+        self.data[Keys.last_sync] = synced_at
         self._save_data()
 
+    def resolve_issue(self, issue):
+        self._set_value(Keys.current_issue, None)
+
     def add_issue(self, issue):
-        if issue.type == 'story':
-            self._add_unique(issue, Keys.stories)
-            self.work_on_story(issue)
-        else:
-            parent = self._get_parent(issue)
-            self._add_subtask(parent, issue)
-            self.work_on_issue(issue)
-        self._save_data()
+        with self.transaction():
+            if issue.type == 'story':
+                self._add_story(issue)
+                self.work_on_story(issue)
+            else:
+                parent = self._get_parent(issue)
+                self._add_subtask(parent, issue)
+                self.work_on_issue(issue)
 
     def work_on_story(self, story):
         """Keep state of current story."""
-        self.data[Keys.current_story] = story
-        self.data[Keys.current_issue] = None
-        self._save_data()
+        with self.transaction():
+            self._set_value(Keys.current_story, story)
+            self._set_value(Keys.current_issue, None)
 
     def work_on_issue(self, issue):
         """Keep state of current issue."""
         parent = self._get_parent(issue)
-        self.work_on_story(parent)
-        self.data[Keys.current_issue] = issue
-        self._save_data()
+        with self.transaction():
+            self._set_value(Keys.current_story, parent)
+            self._set_value(Keys.current_issue, issue)
 
     def finish(self, story):
         if self.get_current_story() == story:
             self.data[Keys.current_story] = None
         self.data[Keys.stories].remove(story)
+        self._build_index()
         self._save_data()
 
     def _get_parent(self, issue):
-        for story in self.data[Keys.stories]:
-            if issue in story.subtasks:
-                return story
+        location = self._get_subtask_location(issue.key)
+        if location is not None:
+            return self._get_story(location[0])
         return self.get_current_story()
 
+    def _get_story(self, key):
+        stories = self.get_stories()
+        position = self._stories_index.get(key)
+        return stories[position] if position is not None else None
+
     def _add_subtask(self, story, subtask):
-        stories = self.data[Keys.stories]
-        stories[stories.index(story)].add_subtask(subtask)
+        stored_story = self._get_story(story.key)
+        if stored_story is None:
+            raise ValueError('{} is not in stories'.format(story))
+        if subtask.key not in self._subtasks_index:
+            stored_story.subtasks.append(subtask)
+            self._subtasks_index[subtask.key] = (story.key, len(stored_story.subtasks) - 1)
+            self._save_data()
+
+    def _get_subtask_location(self, key):
+        """Return parent story key and position of stored subtask."""
+        self.data  # index is built when data is loaded
+        return self._subtasks_index.get(key)
 
-    def _add_unique(self, issue, collection):
-        if not any(i.key == issue.key for i in self.data[collection]):
-            self.data[collection].append(issue)
+    def _add_story(self, story):
+        stories = self.get_stories()
+        if story.key not in self._stories_index:
+            stories.append(story)
+            self._stories_index[story.key] = len(stories) - 1
+            self._index_subtasks(story)
+            self._save_data()
+
+    def _build_index(self):
+        self._stories_index = {}
+        self._subtasks_index = {}
+        for position, story in enumerate(self.data[Keys.stories]):
+            self._stories_index[story.key] = position
+            self._index_subtasks(story)
+
+    def _index_subtasks(self, story):
+        for position, subtask in enumerate(story.subtasks):
+            self._subtasks_index[subtask.key] = (story.key, position)
+
+    def _unindex_subtasks(self, story):
+        for subtask in story.subtasks:
+            if self._subtasks_index.get(subtask.key, (None,))[0] == story.key:
+                del self._subtasks_index[subtask.key]
 
     def _get_value(self, key):
         if key in self.data:
             return self.data[key]
         return None
 
+    def _set_value(self, key, issue):
+        if not _same_issue(self._get_value(key), issue):
+            self.data[key] = issue
+            self._save_data()
+
+
+def _mtime(file):
+    try:
+        return os.stat(file).st_mtime_ns
+    except OSError:
+        return None
+
 
-storage_schema = StorageSchema()
-storage = Storage(config.DATA_FILE, storage_schema)
+def _same_issue(issue, other):
+    """Check if issues are stored the same way."""
+    if issue is None or other is None:
+        return issue is other
+    return ((issue.key, issue.summary, issue.type, issue.status) ==
+            (other.key, other.summary, other.type, other.status))
+
+
+def _decode(data):
+    """Build storage data from JSON document."""
+    def issue(value, subtasks=False):
+        if value is None:
+            return None
+        return JiraIssue(*[value.get(field) for field in ISSUE_FIELDS],
+                         subtasks=[issue(s) for s in value.get('subtasks', [])] if subtasks else [])
+
+    return {
+        Keys.current_story: issue(data.get(Keys.current_story)),
+        Keys.current_issue: issue(data.get(Keys.current_issue)),
+        Keys.stories: [issue(story, subtasks=True) for story in data.get(Keys.stories) or []],
+        Keys.last_sync: data.get(Keys.last_sync),
+    }
+
+
+def _encode(data):
+    """Build JSON document from storage data."""
+    def issue(value, subtasks=False):
+        if value is None:
+            return None
+        encoded = {field: getattr(value, field) for field in ISSUE_FIELDS}
+        if subtasks:
+            encoded['subtasks'] = [issue(s) for s in value.subtasks]
+        return encoded
+
+    return {
+        Keys.current_story: issue(data.get(Keys.current_story)),
+        Keys.current_issue: issue(data.get(Keys.current_issue)),
+        Keys.stories: [issue(story, subtasks=True) for story in data.get(Keys.stories) or []],
+        Keys.last_sync: data.get(Keys.last_sync),
+    }
+
+
+def _create_storage():
+    if config.STORAGE == 'sqlite':
+        from jira_git_flow.sqlite_storage import SqliteStorage
+        return SqliteStorage(config.DATABASE_FILE, json_file=config.DATA_FILE)
+    return Storage(config.DATA_FILE)
+
+
+storage = _create_storage()
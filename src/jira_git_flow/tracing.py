@@ -0,0 +1,114 @@
+"""Timed spans of Jira calls, git commands and storage I/O."""
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import click
+
+
+class Tracer(object):
+    """
+    Records timed spans when enabled.
+
+    Spans are kept in memory and reported at the end of command as a summary
+    table or Chrome trace-event JSON (chrome://tracing, Perfetto).
+    """
+    def __init__(self):
+        self.enabled = False
+        self.spans = []
+        self.counters = {}
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def enable(self):
+        """Start recording of a new command."""
+        self.enabled = True
+        self.spans = []
+        self.counters = {}
+        self._start = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self._start
+
+    def count(self, name, value=1):
+        """Increase named counter, e.g. of cache hits."""
+        if self.enabled:
+            with self._lock:
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    @contextmanager
+    def span(self, category, name):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            with self._lock:
+                self.spans.append((category, name, start - self._start, end - start,
+                                   threading.get_ident()))
+
+    def summary(self):
+        """Return (category, name, calls, total seconds, max seconds) rows, the slowest first."""
+        rows = {}
+        for category, name, _, duration, _ in self.spans:
+            calls, total, longest = rows.get((category, name), (0, 0.0, 0.0))
+            rows[(category, name)] = (calls + 1, total + duration, max(longest, duration))
+        return sorted((key + value for key, value in rows.items()), key=lambda row: -row[3])
+
+    def print_summary(self):
+        wall = self.elapsed
+        click.echo('{:<8} {:<32} {:>6} {:>10} {:>10}'.format(
+            'category', 'name', 'calls', 'total ms', 'max ms'), err=True)
+        for category, name, calls, total, longest in self.summary():
+            click.echo('{:<8} {:<32} {:>6} {:>10.1f} {:>10.1f}'.format(
+                category, name, calls, total * 1000, longest * 1000), err=True)
+        for name, value in sorted(self.counters.items()):
+            click.echo('{:<41} {:>6}'.format(name, value), err=True)
+        click.echo('Command took {:.1f} ms.'.format(wall * 1000), err=True)
+
+    def write_chrome_trace(self, file):
+        pid = os.getpid()
+        events = [{'name': name, 'cat': category, 'ph': 'X', 'ts': start * 1e6,
+                   'dur': duration * 1e6, 'pid': pid, 'tid': tid}
+                  for category, name, start, duration, tid in self.spans]
+        with open(file, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+
+tracer = Tracer()
+
+
+def traced(category, name=None):
+    """
+    Record span of every call of decorated function.
+
+    Span of generator function covers the whole iteration.
+    """
+    def decorator(function):
+        span_name = name or function.__name__
+
+        if inspect.isgeneratorfunction(function):
+            @functools.wraps(function)
+            def generator_wrapper(*args, **kwargs):
+                if not tracer.enabled:
+                    return (yield from function(*args, **kwargs))
+                with tracer.span(category, span_name):
+                    return (yield from function(*args, **kwargs))
+            return generator_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return function(*args, **kwargs)
+            with tracer.span(category, span_name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -1,5 +1,8 @@
 """Utilities"""
+import os
 import re
+import tempfile
+
 from jira_git_flow import config
 from jira_git_flow.models import JiraIssue
 
@@ -11,3 +14,32 @@ def generate_branch_name(issue):
     summary = re.sub(r"[^a-zA-Z0-9]+", ' ', issue_model.summary).lower().replace(' ', '-')
     branch = '{}{}-{}'.format(prefix, issue_model.key, summary)
     return branch[0:70]
+
+
+def get_flatten_issues(stories):
+    """Return list of stories, each followed by its subtasks."""
+    flatten_issues = []
+    for story in stories:
+        flatten_issues.append(story)
+        flatten_issues.extend(story.subtasks)
+    return flatten_issues
+
+
+def write_atomic(path, text):
+    """
+    Write file atomically.
+
+    Text is written to temporary file in the same directory which replaces
+    the target once it is flushed to disk, so a crash leaves either old or new
+    content in place.
+    """
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
@@ -0,0 +1 @@
+"""jira-git-flow tests."""
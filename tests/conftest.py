@@ -0,0 +1,18 @@
+"""Run tests with configuration and data in temporary HOME."""
+import json
+import os
+import sys
+import tempfile
+
+os.environ['HOME'] = tempfile.mkdtemp()
+_base = os.path.join(os.environ['HOME'], '.config', 'jira-git-flow')
+os.makedirs(_base)
+with open(os.path.join(_base, 'credentials.json'), 'w') as f:
+    json.dump({'username': 'tester', 'email': 'tester@localhost', 'token': 'token'}, f)
+
+try:
+    import jira_git_flow  # noqa: F401
+except SystemExit:
+    # Default configuration was written, load it.
+    for name in [name for name in sys.modules if name.startswith('jira_git_flow')]:
+        del sys.modules[name]
@@ -0,0 +1,48 @@
+"""Tests of replay of queued actions."""
+import jira_git_flow
+from jira_git_flow import config
+from jira_git_flow.models import JiraIssue
+from jira_git_flow.offline import ActionQueue
+from jira_git_flow.storage import Storage
+from tests.test_sync import jira_issue
+
+
+class FakeJira(object):
+    """Jira client returning issues fetched before any transition."""
+    def __init__(self, issues):
+        self.issues = issues
+        self.transitions = []
+
+    def get_issues_by_keys(self, keys):
+        return [self.issues[key] for key in keys]
+
+    def transition_issue(self, key, transition, state=None):
+        self.transitions.append((key, transition))
+
+    def assign_issue(self, key, assignee):
+        pass
+
+
+def test_subtask_queued_before_story_keeps_replayed_status(tmp_path, monkeypatch):
+    storage = Storage(str(tmp_path / 'data.json'))
+    story = JiraIssue('PRJ-1', 'PRJ-1', 'story', 'open')
+    subtask = JiraIssue('PRJ-2', 'PRJ-2', 'feature', 'open')
+    storage.sync([JiraIssue('PRJ-1', 'PRJ-1', 'story', 'open', [subtask])])
+    queue = ActionQueue(str(tmp_path / 'queue.jsonl'))
+    action = config.ISSUE_ACTIONS['default']['start_progress']
+    queue.append(subtask, 'start_progress', action, None)
+    queue.append(story, 'start_progress', action, None)
+    monkeypatch.setattr(jira_git_flow, 'storage', storage)
+    monkeypatch.setattr(jira_git_flow, 'action_queue', queue)
+    remote_story = jira_issue('PRJ-1', 'Story', 'Open')
+    remote_subtask = jira_issue('PRJ-2', 'Feature Sub-task', 'Open', parent='PRJ-1')
+    remote_story.fields.subtasks = [remote_subtask]
+    jira = FakeJira({'PRJ-1': remote_story, 'PRJ-2': remote_subtask})
+
+    jira_git_flow._flush_queue(jira)
+
+    assert sorted(jira.transitions) == [('PRJ-1', 'Start progress'), ('PRJ-2', 'Start progress')]
+    assert not queue
+    stored = storage.get_stories()[0]
+    assert [(issue.key, issue.status) for issue in [stored] + stored.subtasks] == [
+        ('PRJ-1', 'in_progress'), ('PRJ-2', 'in_progress')]
@@ -0,0 +1,20 @@
+"""Tests of repository context cache."""
+import subprocess
+
+from jira_git_flow import git
+
+GIT = ['git', '-c', 'user.name=tester', '-c', 'user.email=tester@localhost']
+
+
+def test_worktree_context_sees_branches_created_in_main_repository(tmp_path, monkeypatch):
+    main, worktree = str(tmp_path / 'main'), str(tmp_path / 'worktree')
+    subprocess.check_call(['git', 'init', '-q', main])
+    subprocess.check_call(GIT + ['commit', '-q', '--allow-empty', '-m', 'Initial'], cwd=main)
+    subprocess.check_call(['git', 'worktree', 'add', '-q', '-b', 'work', worktree], cwd=main)
+    monkeypatch.chdir(worktree)
+    assert not git.get_context().branch_exists('f/new')
+
+    subprocess.check_call(['git', 'branch', 'f/new'], cwd=main)
+
+    assert git.get_context().branch_exists('f/new')
+    assert git.get_context().head == 'work'
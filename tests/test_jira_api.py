@@ -0,0 +1,25 @@
+"""Tests of Jira queries."""
+from jira_git_flow.jira_api import Jira
+
+
+def search_query(keyword, type=None):
+    jira = Jira('https://jira', 'user', 'token', 'PRJ', 100)
+    queries = []
+    jira._search_all = lambda query, fields=None: queries.append(query) or []
+    jira.search_issues(keyword, type=type)
+    return queries[0]
+
+
+def test_search_is_limited_to_project():
+    assert search_query('login', type='Story') == (
+        'project = "PRJ" AND (summary ~ "login") AND type = "Story" order by created desc')
+
+
+def test_search_escapes_text_search_characters():
+    assert search_query('fix: C++ "login"') == (
+        r'project = "PRJ" AND (summary ~ "fix\\: C\\+\\+ \"login\"") order by created desc')
+
+
+def test_search_matches_key():
+    assert search_query('prj-12') == (
+        'project = "PRJ" AND (summary ~ "prj\\\\-12" OR key = "PRJ-12") order by created desc')
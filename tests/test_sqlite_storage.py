@@ -0,0 +1,36 @@
+"""Tests of SQLite storage."""
+import sqlite3
+
+import pytest
+
+from jira_git_flow.models import JiraIssue
+from jira_git_flow.sqlite_storage import SqliteStorage
+
+
+@pytest.fixture
+def database(tmp_path):
+    file = str(tmp_path / 'data.sqlite')
+    storage = SqliteStorage(file)
+    storage.sync([JiraIssue('PRJ-1', 'Story', 'story', 'open',
+                            [JiraIssue('PRJ-2', 'Feature', 'feature', 'open')])], 1.0)
+    storage.work_on_story(storage.get_stories()[0])
+    storage.db.close()
+    return file
+
+
+def test_valid_data_is_loaded(database):
+    storage = SqliteStorage(database, validate=True)
+    assert [story.key for story in storage.get_stories()] == ['PRJ-1']
+
+
+@pytest.mark.parametrize('statement', [
+    "UPDATE stories SET status = NULL",
+    "UPDATE subtasks SET story_key = 'PRJ-9'",
+    "UPDATE state SET value = '{' WHERE name = 'current_story'",
+])
+def test_invalid_data_is_reported(database, statement):
+    with sqlite3.connect(database) as db:
+        db.execute(statement)
+    with pytest.raises(SystemExit):
+        SqliteStorage(database, validate=True).get_stories()
+    assert SqliteStorage(database).get_stories()
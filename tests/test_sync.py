@@ -0,0 +1,30 @@
+"""Tests of incremental sync."""
+from types import SimpleNamespace
+
+from jira_git_flow import _split_updated_issues
+from jira_git_flow.models import JiraIssue
+from jira_git_flow.storage import Storage
+
+
+def jira_issue(key, type_name, status, parent=None):
+    fields = SimpleNamespace(summary=key, issuetype=SimpleNamespace(name=type_name),
+                             status=SimpleNamespace(name=status), subtasks=[])
+    if parent:
+        fields.parent = SimpleNamespace(key=parent)
+    return SimpleNamespace(key=key, fields=fields)
+
+
+def test_story_in_epic_is_updated(tmp_path):
+    storage = Storage(str(tmp_path / 'data.json'))
+    storage.sync([JiraIssue('PRJ-1', 'PRJ-1', 'story', 'open',
+                            [JiraIssue('PRJ-2', 'PRJ-2', 'feature', 'open')])])
+    updated = [jira_issue('PRJ-1', 'Story', 'In Progress', parent='PRJ-100'),
+               jira_issue('PRJ-2', 'Feature Sub-task', 'Review', parent='PRJ-1')]
+
+    stories, subtasks = _split_updated_issues(updated, ['PRJ-1'])
+    storage.merge(stories, subtasks, 0)
+
+    story = storage.get_stories()[0]
+    assert [story.key] == [issue.key for issue in stories]
+    assert story.status == 'in_progress'
+    assert [(subtask.key, subtask.status) for subtask in story.subtasks] == [('PRJ-2', 'in_review')]